@@ -0,0 +1,28 @@
+"""Add spend index to blockchain_input and address index to blockchain_output
+
+Revision ID: 3c1e8d5a7f20
+Revises: b9ba44cc56ab
+Create Date: 2026-10-18 15:42:07.503117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1e8d5a7f20'
+down_revision: Union[str, None] = 'b9ba44cc56ab'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_blockchain_input_network_outxid_vout', 'blockchain_input', ['network', 'outxid', 'vout'], unique=False)
+    op.create_index('ix_blockchain_output_network_address', 'blockchain_output', ['network', 'address'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_blockchain_output_network_address', table_name='blockchain_output')
+    op.drop_index('ix_blockchain_input_network_outxid_vout', table_name='blockchain_input')
@@ -0,0 +1,26 @@
+"""Add partial index of unconfirmed blockchain transactions
+
+Revision ID: 5b2f7c9e3a18
+Revises: d47a3e1b6c05
+Create Date: 2026-10-18 23:12:40.618204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b2f7c9e3a18'
+down_revision: Union[str, None] = 'd47a3e1b6c05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_blockchain_transaction_unconfirmed', 'blockchain_transaction', ['network', 'created_at'], unique=False, postgresql_where=sa.text('blockheight = -1'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_blockchain_transaction_unconfirmed', table_name='blockchain_transaction', postgresql_where=sa.text('blockheight = -1'))
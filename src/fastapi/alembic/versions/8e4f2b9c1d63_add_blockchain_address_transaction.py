@@ -0,0 +1,41 @@
+"""Add blockchain_address_transaction index table
+
+Revision ID: 8e4f2b9c1d63
+Revises: 3c1e8d5a7f20
+Create Date: 2026-10-18 17:10:52.884310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e4f2b9c1d63'
+down_revision: Union[str, None] = '3c1e8d5a7f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('blockchain_address_transaction',
+    sa.Column('network', postgresql.ENUM('mainnet', 'testnet', name='networktype', create_type=False), nullable=False),
+    sa.Column('address', sa.String(), nullable=False),
+    sa.Column('txid', sa.LargeBinary(), nullable=False),
+    sa.ForeignKeyConstraint(['network', 'txid'], ['blockchain_transaction.network', 'blockchain_transaction.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('network', 'address', 'txid')
+    )
+    # index cached transactions, funding and spending (with cached previous output) side
+    op.execute(
+        'INSERT INTO blockchain_address_transaction (network, address, txid) '
+        'SELECT network, address, txid FROM blockchain_output WHERE address IS NOT NULL '
+        'UNION '
+        'SELECT i.network, o.address, i.txid FROM blockchain_input i JOIN blockchain_output o '
+        'ON o.network = i.network AND o.txid = i.outxid AND o.vout = i.vout WHERE o.address IS NOT NULL'
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('blockchain_address_transaction')
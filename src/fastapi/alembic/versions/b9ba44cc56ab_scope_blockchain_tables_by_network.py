@@ -0,0 +1,84 @@
+"""Scope blockchain tables by network
+
+Revision ID: b9ba44cc56ab
+Revises: 0de26a6f3759
+Create Date: 2026-10-18 12:04:31.218734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b9ba44cc56ab'
+down_revision: Union[str, None] = '0de26a6f3759'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+networktype = postgresql.ENUM('mainnet', 'testnet', name='networktype', create_type=False)
+
+
+def upgrade() -> None:
+    for table in ['blockchain_input', 'blockchain_output', 'blockchain_unspent']:
+        op.add_column(table, sa.Column('network', networktype, nullable=True))
+
+    # fill network from parent transactions
+    for table in ['blockchain_input', 'blockchain_output', 'blockchain_unspent']:
+        op.execute(
+            f'UPDATE {table} SET network = t.network '
+            f'FROM blockchain_transaction t WHERE t.id = {table}.txid'
+        )
+    # unspent without cached transaction, testnet addresses start with m, n, 2 or tb1
+    op.execute(
+        "UPDATE blockchain_unspent SET network = CASE "
+        "WHEN address LIKE 'tb1%' OR left(address, 1) IN ('m', 'n', '2') "
+        "THEN 'testnet'::networktype ELSE 'mainnet'::networktype END "
+        "WHERE network IS NULL"
+    )
+    for table in ['blockchain_input', 'blockchain_output', 'blockchain_unspent']:
+        op.alter_column(table, 'network', existing_type=networktype, nullable=False)
+
+    op.drop_constraint('blockchain_input_txid_fkey', 'blockchain_input', type_='foreignkey')
+    op.drop_constraint('blockchain_output_txid_fkey', 'blockchain_output', type_='foreignkey')
+
+    op.drop_constraint('blockchain_transaction_pkey', 'blockchain_transaction', type_='primary')
+    op.create_primary_key('blockchain_transaction_pkey', 'blockchain_transaction', ['network', 'id'])
+    op.drop_constraint('blockchain_input_pkey', 'blockchain_input', type_='primary')
+    op.create_primary_key('blockchain_input_pkey', 'blockchain_input', ['network', 'txid', 'index'])
+    op.drop_constraint('blockchain_output_pkey', 'blockchain_output', type_='primary')
+    op.create_primary_key('blockchain_output_pkey', 'blockchain_output', ['network', 'txid', 'vout'])
+    op.drop_constraint('blockchain_unspent_pkey', 'blockchain_unspent', type_='primary')
+    op.create_primary_key('blockchain_unspent_pkey', 'blockchain_unspent', ['network', 'txid', 'vout'])
+
+    op.create_foreign_key('blockchain_input_network_txid_fkey', 'blockchain_input', 'blockchain_transaction', ['network', 'txid'], ['network', 'id'], ondelete='CASCADE')
+    op.create_foreign_key('blockchain_output_network_txid_fkey', 'blockchain_output', 'blockchain_transaction', ['network', 'txid'], ['network', 'id'], ondelete='CASCADE')
+
+    op.drop_index('ix_blockchain_unspent_address', table_name='blockchain_unspent')
+    op.create_index('ix_blockchain_unspent_network_address', 'blockchain_unspent', ['network', 'address'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_blockchain_unspent_network_address', table_name='blockchain_unspent')
+    op.create_index(op.f('ix_blockchain_unspent_address'), 'blockchain_unspent', ['address'], unique=False)
+
+    op.drop_constraint('blockchain_output_network_txid_fkey', 'blockchain_output', type_='foreignkey')
+    op.drop_constraint('blockchain_input_network_txid_fkey', 'blockchain_input', type_='foreignkey')
+
+    op.drop_constraint('blockchain_unspent_pkey', 'blockchain_unspent', type_='primary')
+    op.create_primary_key('blockchain_unspent_pkey', 'blockchain_unspent', ['txid', 'vout'])
+    op.drop_constraint('blockchain_output_pkey', 'blockchain_output', type_='primary')
+    op.create_primary_key('blockchain_output_pkey', 'blockchain_output', ['txid', 'vout'])
+    op.drop_constraint('blockchain_input_pkey', 'blockchain_input', type_='primary')
+    op.create_primary_key('blockchain_input_pkey', 'blockchain_input', ['txid', 'index'])
+    op.drop_constraint('blockchain_transaction_pkey', 'blockchain_transaction', type_='primary')
+    op.create_primary_key('blockchain_transaction_pkey', 'blockchain_transaction', ['id'])
+
+    op.create_foreign_key('blockchain_output_txid_fkey', 'blockchain_output', 'blockchain_transaction', ['txid'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('blockchain_input_txid_fkey', 'blockchain_input', 'blockchain_transaction', ['txid'], ['id'], ondelete='CASCADE')
+
+    for table in ['blockchain_unspent', 'blockchain_output', 'blockchain_input']:
+        op.drop_column(table, 'network')
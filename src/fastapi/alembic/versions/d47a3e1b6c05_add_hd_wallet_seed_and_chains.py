@@ -0,0 +1,54 @@
+"""Add hd wallet seed and chains, address can have hdindex instead of key
+
+Revision ID: d47a3e1b6c05
+Revises: 8e4f2b9c1d63
+Create Date: 2026-10-18 21:04:31.270518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd47a3e1b6c05'
+down_revision: Union[str, None] = '8e4f2b9c1d63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('user_bitcoin_seed',
+    sa.Column('userid', sa.Integer(), nullable=False),
+    sa.Column('encrypted', sa.LargeBinary(), nullable=False),
+    sa.Column('dsha256_digest', sa.LargeBinary(length=32), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    sa.ForeignKeyConstraint(['userid'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('userid')
+    )
+    op.create_table('user_bitcoin_chain',
+    sa.Column('userid', sa.Integer(), nullable=False),
+    sa.Column('type', postgresql.ENUM('P2PKH', 'P2SH_P2WPKH', 'P2WPKH', 'P2WSH', 'P2TR', name='addresstype', create_type=False), nullable=False),
+    sa.Column('network', postgresql.ENUM('mainnet', 'testnet', name='networktype', create_type=False), nullable=False),
+    sa.Column('pubkey', sa.LargeBinary(length=33), nullable=False),
+    sa.Column('chaincode', sa.LargeBinary(length=32), nullable=False),
+    sa.Column('nextindex', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['userid'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('userid', 'type', 'network')
+    )
+    op.add_column('user_bitcoin_address', sa.Column('hdindex', sa.Integer(), nullable=True))
+    op.alter_column('user_bitcoin_address', 'keyid', existing_type=sa.INTEGER(), nullable=True)
+    op.create_unique_constraint('user_bitcoin_address_userid_type_network_hdindex_key', 'user_bitcoin_address', ['userid', 'type', 'network', 'hdindex'])
+    op.create_check_constraint('ck_user_bitcoin_address_key_or_hdindex', 'user_bitcoin_address', '(keyid IS NULL) != (hdindex IS NULL)')
+
+
+def downgrade() -> None:
+    op.execute('DELETE FROM user_bitcoin_address WHERE hdindex IS NOT NULL')
+    op.drop_constraint('ck_user_bitcoin_address_key_or_hdindex', 'user_bitcoin_address', type_='check')
+    op.drop_constraint('user_bitcoin_address_userid_type_network_hdindex_key', 'user_bitcoin_address', type_='unique')
+    op.alter_column('user_bitcoin_address', 'keyid', existing_type=sa.INTEGER(), nullable=False)
+    op.drop_column('user_bitcoin_address', 'hdindex')
+    op.drop_table('user_bitcoin_chain')
+    op.drop_table('user_bitcoin_seed')
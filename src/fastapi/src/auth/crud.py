@@ -1,19 +1,32 @@
+import asyncio
 import secrets
 import datetime
-from sqlalchemy import select
+from sqlalchemy import select, update, delete, or_
 from sqlalchemy.orm import joinedload
 
 from ..config import settings
 from ..database import SessionLocal
+from ..cache import MemoryCache
 from ..models import User
 from ..wallet import cryptoutils as cu
+from ..wallet.keyring import keyring
 from .models import UserSession
 
 
+# token: UserSession (with loaded user), saves a db query per authenticated request
+sessioncache = MemoryCache(settings.USER_SESSION_CACHE_SIZE, settings.USER_SESSION_CACHE_TTL)
+
+
+def utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+
+
 async def add_user(username: str, password: str) -> User:
-    pwdhash = cu.context.hash(password)
     ck = cu.generatekey()
-    options, kdf, encrypted = cu.kdfencrypt(password, ck)
+    pwdhash, (options, kdf, encrypted) = await asyncio.gather(
+        cu.apwdhash(password),
+        cu.akdfencrypt(password, ck)
+    )
 
     async with SessionLocal() as session, session.begin():
         session.add(u := User(
@@ -28,7 +41,7 @@ async def add_user(username: str, password: str) -> User:
 
 async def add_usersession(userid: int, ip: str | None, user_agent: str | None) -> UserSession:
     token = secrets.token_urlsafe(settings.USER_TOKEN_LENGTH)
-    now = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+    now = utcnow()
     expire = now + datetime.timedelta(days=settings.USER_SESSION_EXPIRATION_DAYS)
     authsession = UserSession(
         token=token,
@@ -44,18 +57,55 @@ async def add_usersession(userid: int, ip: str | None, user_agent: str | None) -
 
 
 async def verify_session(token: str) -> UserSession | None:
-    async with SessionLocal() as s:
-        session = await s.scalar(
-            select(UserSession)
+    if not (session := sessioncache.getnowait(token)):
+        async with SessionLocal() as s:
+            session = await s.scalar(
+                select(UserSession)
+                .where(UserSession.token == token)
+                .options(joinedload(UserSession.user))
+            )
+        if not session:
+            return
+        sessioncache.setnowait(token, session)
+
+    if session.revoked or utcnow() > session.expire:
+        await delete_session(token)
+        return
+
+    return session
+
+
+async def revoke_session(token: str) -> None:
+    sessioncache.deletenowait(token)
+    keyring.lock(token)
+    async with SessionLocal() as session, session.begin():
+        await session.execute(
+            update(UserSession)
             .where(UserSession.token == token)
-            .options(joinedload(UserSession.user))
+            .values(revoked=True)
         )
 
-        if not session:
-            return
 
-        if session.revoked or datetime.datetime.now(datetime.UTC).replace(tzinfo=None) > session.expire:
-            await s.delete(session)
-            return
+async def delete_session(token: str) -> None:
+    sessioncache.deletenowait(token)
+    keyring.lock(token)
+    async with SessionLocal() as session, session.begin():
+        await session.execute(
+            delete(UserSession)
+            .where(UserSession.token == token)
+        )
 
-        return session
+
+async def delete_expired_sessions() -> int:
+    """
+    :return: Number of deleted sessions
+    """
+    async with SessionLocal() as session, session.begin():
+        tokens = (await session.scalars(
+            delete(UserSession)
+            .where(or_(UserSession.revoked, UserSession.expire < utcnow()))
+            .returning(UserSession.token)
+        )).all()
+    sessioncache.deletenowait(*tokens)
+    keyring.lock(*tokens)
+    return len(tokens)
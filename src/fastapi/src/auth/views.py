@@ -7,7 +7,7 @@ from fastapi.exceptions import RequestValidationError
 from ..models import User
 from ..crud import getuser_by_username
 from ..wallet import cryptoutils as cu
-from . import crud, currentuser, schema, models, exceptions
+from . import crud, currentuser, currentsession, schema, models, exceptions
 
 
 router = APIRouter(prefix='/auth')
@@ -43,13 +43,18 @@ async def signin(formdata: Annotated[OAuth2PasswordRequestForm, Depends()], requ
     # todo: merge wrong pass/user not found and raise one error
     if not u:
         raise exceptions.UserNotFoundError
-    if not cu.context.verify(formdata.password, u.pwd):
+    if not await cu.apwdverify(formdata.password, u.pwd):
         raise exceptions.InvalidPasswordError
 
     session = await add_usersession(u, request)
     return schema.UserSession(username=u.username, access_token=session.token, expire=session.expire)
 
 
+@router.post('/signout', status_code=status.HTTP_204_NO_CONTENT)
+async def signout(session: Annotated[models.UserSession, Depends(currentsession)]):
+    await crud.revoke_session(session.token)
+
+
 @router.post('/change-password')
 async def change_password(session: Annotated[models.UserSession, Depends(currentuser)]):
     pass  # todo:
@@ -0,0 +1,107 @@
+import time
+import pickle
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any
+
+from redis import asyncio as aioredis
+
+from .config import settings
+
+
+class Cache(ABC):
+    """
+    Bounded key-value cache with TTL
+    """
+    def __init__(self, ttl: float | None = None):
+        self.ttl = ttl
+
+    @abstractmethod
+    async def get(self, key: str, default: Any = None) -> Any:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        """
+        :param ttl: key ttl in seconds, cache default ttl is used if not specified
+        """
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        ...
+
+
+class MemoryCache(Cache):
+    """
+    In-process cache, least recently used keys are evicted when maxsize is exceeded
+    """
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        super().__init__(ttl)
+        self.maxsize = maxsize
+        self.data: OrderedDict[str, tuple[float, Any]] = OrderedDict()  # key: (expire, value)
+
+    def getnowait(self, key: str, default: Any = None) -> Any:
+        if not (item := self.data.get(key)):
+            return default
+
+        expire, value = item
+        if expire < time.monotonic():
+            del self.data[key]
+            return default
+
+        self.data.move_to_end(key)
+        return value
+
+    def setnowait(self, key: str, value: Any, ttl: float | None = None) -> None:
+        ttl = ttl or self.ttl
+        self.data[key] = (time.monotonic() + ttl if ttl else float('inf'), value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def deletenowait(self, *keys: str) -> None:
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        return self.getnowait(key, default)
+
+    async def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        self.setnowait(key, value, ttl)
+
+    async def delete(self, *keys: str) -> None:
+        self.deletenowait(*keys)
+
+
+class RedisCache(Cache):
+    """
+    Shared (between workers) cache. Eviction is done by redis itself (maxmemory-policy allkeys-lru)
+    """
+    def __init__(self, url: str, namespace: str, ttl: float | None = None):
+        super().__init__(ttl)
+        self.namespace = namespace
+        self.redis = aioredis.from_url(url)
+
+    def key(self, key: str) -> str:
+        return f'{self.namespace}:{key}'
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        value = await self.redis.get(self.key(key))
+        return default if value is None else pickle.loads(value)
+
+    async def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        ttl = ttl or self.ttl
+        await self.redis.set(self.key(key), pickle.dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self.redis.delete(*map(self.key, keys))
+
+
+def create(namespace: str, maxsize: int, ttl: float | None = None) -> Cache:
+    """
+    Shared cache if CACHE_REDIS_URL is set, in-process otherwise
+    """
+    if settings.CACHE_REDIS_URL:
+        return RedisCache(settings.CACHE_REDIS_URL, namespace, ttl)
+    return MemoryCache(maxsize, ttl)
@@ -14,9 +14,54 @@ class Settings(BaseSettings):
 
     USER_TOKEN_LENGTH: int = 32
     USER_SESSION_EXPIRATION_DAYS: int = 14
+    USER_SESSION_CACHE_SIZE: int = 10_000
+    USER_SESSION_CACHE_TTL: int = 60  # in seconds, revocation by another worker is seen after it
+    USER_SESSION_CLEANUP_INTERVAL: int = 3600  # in seconds
+
+    WALLET_KEYRING_SIZE: int = 1000  # unlocked sessions (decrypted common keys) per worker
+    WALLET_KEYRING_TTL: int = 300  # in seconds, default unlock time
+    WALLET_KEYRING_MAX_TTL: int = 3600
+
+    WALLET_SIGN_POOL_WORKERS: int | None = None  # cpu count by default
+    WALLET_SIGN_POOL_MAX_PENDING: int = 64  # queued + running signing jobs
+    WALLET_SIGN_CHUNK_SIZE: int = 16  # min inputs signed by one job
+    WALLET_DERIVED_ADDRESS_CACHE_SIZE: int = 10_000
+    WALLET_BATCH_MAX_ADDRESSES: int = 10_000  # addresses per batch creation request
+    WALLET_KEYGEN_CHUNK_SIZE: int = 256  # min keys generated by one job
+    WALLET_HD_CACHE_SIZE: int = 10_000  # derived hd private nodes (chains and children)
+    WALLET_HD_CACHE_TTL: int = 300  # in seconds
+
+    KDF_POOL_WORKERS: int | None = None  # cpu count by default
+    KDF_POOL_MAX_PENDING: int = 64  # queued + running argon2 jobs, 429 is returned above it
 
     EXPLORER_FOR_LOGINED_ONLY: bool = False
-    EXPLORER_HEAD_BLOCK_CACHE_TTL: int = 60  # in seconds
+    EXPLORER_HEAD_POLL_INTERVAL: int = 30  # in seconds
+    EXPLORER_RECONCILE_BATCH_SIZE: int = 50  # transactions per explorer request
+    EXPLORER_UNCONFIRMED_MAX_AGE: int = 14 * 24 * 3600  # in seconds, unconfirmed cached longer aren't reconciled (mempool expiry)
+    EXPLORER_HOST_MAX_CONNECTIONS: int = 100  # per explorer host
+    EXPLORER_HOST_MAX_KEEPALIVE: int = 20
+    EXPLORER_LATENCY_EWMA_ALPHA: float = 0.2
+    EXPLORER_HEDGING: bool = True  # send idempotent request to the next explorer if first one is slow
+    EXPLORER_HEDGE_PERCENTILE: float = 0.95  # of explorer response time, used as hedge delay
+    EXPLORER_BREAKER_THRESHOLD: int = 5  # consecutive failures to open explorer circuit breaker
+    EXPLORER_BREAKER_RESET_TIMEOUT: int = 30  # in seconds, before probing opened explorer
+    EXPLORER_BREAKER_PROBES: int = 1  # concurrent probe requests in half-open state
+    EXPLORER_RATE_LIMITS: dict[str, float] = {  # requests per second per explorer host (by class name)
+        'BlockchainAPI': 5,
+        'BlockstreamAPI': 10,
+        'BlockchairAPI': 1
+    }
+    EXPLORER_RATE_BURST: int = 10  # token bucket capacity
+    EXPLORER_RATE_MAX_WAIT: float = 5  # in seconds, request is queued for a token before explorer is skipped
+    EXPLORER_BATCH_MAX_ADDRESSES: int = 500  # per batch unspent request
+    EXPLORER_BATCH_CONCURRENCY: int = 10  # concurrent explorer requests of one batch
+    EXPLORER_HISTORY_PAGE_SIZE: int = 25  # address transactions page (db, stream), max fetched delta
+    EXPLORER_STREAM_MAX_LENGTH: int = 1000  # transactions per stream request, rest is continued by cursor
+    EXPLORER_TRANSACTION_DECODE: bool = False  # build transaction detail by decoding serialized, not from inputs/outputs tables
+    EXPLORER_ADDRESS_CACHE_TTL: int = 30  # in seconds
+    EXPLORER_ADDRESS_CACHE_SIZE: int = 10_000
+
+    CACHE_REDIS_URL: str | None = None  # shared cache and rate limit backend, in-process if not set
 
     model_config = SettingsConfigDict(env_file='.env')
 
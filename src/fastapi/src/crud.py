@@ -1,4 +1,4 @@
-from typing import Any, Coroutine
+from typing import Any, Coroutine, Iterable
 from sqlalchemy import select
 from sqlalchemy.exc import NoResultFound, IntegrityError
 from asyncpg.exceptions import UniqueViolationError
@@ -8,6 +8,18 @@ from .models import User
 
 
 NoResultError = NoResultFound('No row was found when one was required')
+PG_MAX_PARAMS = 32767  # max bind parameters per statement
+
+
+def chunked(rows: list[dict[str, Any]]) -> Iterable[list[dict[str, Any]]]:
+    """
+    Split multi-row VALUES into chunks fitting postgres bind parameters limit
+    """
+    if not rows:
+        return
+    size = max(1, PG_MAX_PARAMS // len(rows[0]))
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
 
 
 async def catch_unique[T](f: Coroutine[Any, Any, T]) -> bool:
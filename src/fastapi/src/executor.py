@@ -0,0 +1,49 @@
+import os
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+from fastapi import HTTPException, status
+
+
+PoolSaturatedError = HTTPException(
+    status.HTTP_429_TOO_MANY_REQUESTS,
+    'server is busy, try again later',
+    headers={'Retry-After': '1'}
+)
+
+
+class BoundedProcessPool:
+    """
+    Process pool for CPU-bound work off the event loop. Number of queued and running
+    jobs is limited, when it's exceeded new jobs are rejected with 429 (backpressure)
+    """
+    def __init__(self, max_workers: int | None, max_pending: int):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.pending = 0
+        self._pool: ProcessPoolExecutor | None = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if not self._pool:
+            self._pool = ProcessPoolExecutor(self.max_workers)
+        return self._pool
+
+    async def run[T](self, f: Callable[..., T], *args) -> T:
+        """
+        :param f: Picklable (module level) function
+        """
+        if self.pending >= self.max_pending:
+            raise PoolSaturatedError
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, f, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
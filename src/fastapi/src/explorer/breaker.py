@@ -0,0 +1,65 @@
+import time
+from enum import StrEnum
+
+
+class CircuitOpen(Exception):
+    ...
+
+
+class State(StrEnum):
+    closed = 'closed'
+    open = 'open'
+    half_open = 'half-open'
+
+
+class CircuitBreaker:
+    """
+    Closed - requests pass, after `threshold` consecutive failures it's opened.
+    Open - requests are rejected for `reset_timeout` seconds, then it's half-opened.
+    Half-open - only `probes` requests pass, success closes it, failure opens it again
+    """
+    def __init__(self, threshold: int, reset_timeout: float, probes: int = 1):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.probes = probes
+        self.state = State.closed
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = 0
+
+    @property
+    def available(self) -> bool:
+        """
+        Whether the request can pass (without taking a probe slot)
+        """
+        match self.state:
+            case State.closed:
+                return True
+            case State.open:
+                return time.monotonic() - self.opened_at >= self.reset_timeout
+            case State.half_open:
+                return self.probing < self.probes
+
+    def acquire(self) -> bool:
+        if not self.available:
+            return False
+        if self.state is State.open:
+            self.state, self.probing = State.half_open, 0
+        if self.state is State.half_open:
+            self.probing += 1
+        return True
+
+    def release(self) -> None:
+        """
+        Give back probe slot of a request that was cancelled
+        """
+        if self.state is State.half_open and self.probing:
+            self.probing -= 1
+
+    def success(self) -> None:
+        self.state, self.failures, self.probing = State.closed, 0, 0
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.state is State.half_open or self.failures >= self.threshold:
+            self.state, self.opened_at = State.open, time.monotonic()
@@ -0,0 +1,333 @@
+import time
+import asyncio
+from typing import ClassVar, Any, Iterable
+from urllib.parse import urlsplit
+
+import httpx
+from btclib import NetworkType, Unspent
+from btclib import service as api
+from btclib.address import BaseAddress
+from btclib.service import DEFAULT_SERVICE_TIMEOUT, AddressInfo, ExplorerError, NotFoundError, \
+                           ExcessiveAddress, AddressOverflowError
+from btclib.transaction import RawTransaction, BroadcastedTransaction
+
+from . import ratelimit
+from ..config import settings
+
+
+EXCESSIVE_ADDRESS_ERRORS = (ExcessiveAddress, AddressOverflowError)
+
+
+class NetworkNotSupported(Exception):
+    ...
+
+
+class TransactionRejected(ExplorerError):
+    """
+    Pushed transaction is rejected (4xx), explorer is alive and answered
+    """
+
+
+class ExplorerAPI:
+    """
+    Asyncio transport for btclib explorers: endpoints, response handling and parsing
+    are btclib's (second base of subclasses, so this class must not define them),
+    requests are sent through httpx.AsyncClient.
+    Connection pool is shared by all instances with the same host (see `ExplorerAPI.client`)
+    """
+    uri: ClassVar[dict[NetworkType, str]]
+    limitcodes: ClassVar[set[int]] = {httpx.codes.TOO_MANY_REQUESTS}  # 4xx of explorer rate limiting
+    _clients: ClassVar[dict[str, httpx.AsyncClient]] = {}
+    _buckets: ClassVar[dict[str, ratelimit.TokenBucket | None]] = {}
+
+    def __init__(self, network: NetworkType):
+        if not self.supports_network(network):
+            raise NetworkNotSupported(f"{type(self).__name__} doesn't support '{network.value}' network")
+        self.network = network
+
+    @property
+    def host(self) -> str:
+        return urlsplit(self.uri[self.network]).netloc
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if not (c := self._clients.get(self.host)):
+            c = self._clients[self.host] = httpx.AsyncClient(
+                follow_redirects=True,
+                timeout=DEFAULT_SERVICE_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=settings.EXPLORER_HOST_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.EXPLORER_HOST_MAX_KEEPALIVE
+                )
+            )
+        return c
+
+    @property
+    def bucket(self) -> ratelimit.TokenBucket | None:
+        """
+        Token bucket shared by requests to the same host, rate by class name (EXPLORER_RATE_LIMITS)
+        """
+        if self.host not in self._buckets:
+            rate = settings.EXPLORER_RATE_LIMITS.get(type(self).__name__)
+            self._buckets[self.host] = ratelimit.create(
+                self.host,
+                rate,
+                settings.EXPLORER_RATE_BURST
+            ) if rate else None
+        return self._buckets[self.host]
+
+    @classmethod
+    async def aclose(cls) -> None:
+        clients = list(cls._clients.values())
+        cls._clients.clear()
+        await asyncio.gather(*(c.aclose() for c in clients))
+
+    async def request(
+        self,
+        method: str,
+        endpoint_key: str,
+        session_params: dict[str, Any] = {},
+        *,
+        handle_response: bool = True,
+        **kwargs
+    ) -> httpx.Response:
+        """
+        :raise RateLimited: Token of host bucket isn't available in EXPLORER_RATE_MAX_WAIT
+        """
+        if bucket := self.bucket:
+            await bucket.acquire(time.monotonic() + settings.EXPLORER_RATE_MAX_WAIT)
+        r = await self.client.request(method, self.get_endpoint(endpoint_key, **kwargs), **session_params)
+        if handle_response:
+            self.handle_response(r)
+        return r
+
+    async def get(
+        self,
+        endpoint_key: str,
+        session_params: dict[str, Any] = {},
+        *,
+        handle_response: bool = True,
+        **kwargs
+    ) -> httpx.Response:
+        return await self.request('GET', endpoint_key, session_params, handle_response=handle_response, **kwargs)
+
+    async def post(
+        self,
+        endpoint_key: str,
+        session_params: dict[str, Any] = {},
+        *,
+        handle_response: bool = True,
+        **kwargs
+    ) -> httpx.Response:
+        return await self.request('POST', endpoint_key, session_params, handle_response=handle_response, **kwargs)
+
+    def handle_push_response(self, r: httpx.Response) -> None:
+        """
+        :raise TransactionRejected: Client error (except rate limiting) on push
+        """
+        if httpx.codes.is_client_error(r.status_code) and r.status_code not in self.limitcodes:
+            raise TransactionRejected(self, r)  # type: ignore
+        self.handle_response(r)
+
+    def collect(
+        self,
+        txids: list[str],
+        transactions: Iterable[BroadcastedTransaction],
+        response: httpx.Response
+    ) -> list[BroadcastedTransaction]:
+        """
+        Order batch response by requested txids
+        :raise NotFoundError: Some of transactions are missing
+        """
+        found = {tx.id.hex(): tx for tx in transactions}
+        if any(txid not in found for txid in txids):
+            raise NotFoundError(self, response)  # type: ignore
+        return [found[txid] for txid in txids]
+
+    async def get_transactions(self, txids: list[str]) -> list[BroadcastedTransaction]:
+        """
+        Explorer without batch endpoint, transactions are requested with bounded concurrency
+        """
+        semaphore = asyncio.Semaphore(settings.EXPLORER_BATCH_CONCURRENCY)
+
+        async def get(txid: str) -> BroadcastedTransaction:
+            async with semaphore:
+                return await self.get_transaction(txid)
+        return list(await asyncio.gather(*map(get, txids)))
+
+
+class BlockstreamAPI(ExplorerAPI, api.BlockstreamAPI):
+    """
+    Esplora REST API (blockstream.info)
+    """
+    async def head(self) -> int:
+        return int((await self.get('head-block')).text)
+
+    async def get_address(self, address: BaseAddress) -> AddressInfo:
+        d = (await self.get('address', address=address.string)).json()
+        _sum = lambda k: d['chain_stats'][k] + d['mempool_stats'][k]
+        return AddressInfo(_sum('funded_txo_sum'), _sum('spent_txo_sum'), _sum('tx_count'), address)
+
+    async def get_transaction(self, txid: str) -> BroadcastedTransaction:
+        return self.process_transaction((await self.get('tx', txid=txid)).json())
+
+    async def get_address_transactions(
+        self,
+        address: BaseAddress,
+        last_seen_txid: str | None = None
+    ) -> list[BroadcastedTransaction]:
+        """
+        Without last_seen_txid mempool transactions (up to 50) and first 25 chain transactions,
+        otherwise 25 chain transactions after last_seen_txid
+        """
+        endpoint = self.get_endpoint('address', address=address.string)
+        if last_seen_txid:
+            r = await self.get('atxs-pag', address_endpoint=endpoint, type='chain', last_seen_txid=last_seen_txid)
+        else:
+            r = await self.get('atxs', address_endpoint=endpoint)
+        return list(map(self.process_transaction, r.json()))
+
+    async def get_unspent(self, address: BaseAddress) -> list[Unspent]:
+        r = await self.get('utxo', address_endpoint=self.get_endpoint('address', address=address.string))
+        return [
+            Unspent(
+                bytes.fromhex(u['txid']),
+                u['vout'],
+                u['value'],
+                u['status'].get('block_height', -1),
+                address
+            )
+            for u in r.json()
+        ]
+
+    async def push(self, tx: RawTransaction) -> bool:
+        r = await self.post('push', {'content': tx.serialize().hex()}, handle_response=False)
+        self.handle_push_response(r)  # 400 is a rejected transaction, not "not found"
+        return True
+
+
+class BlockchainAPI(ExplorerAPI, api.BlockchainAPI):
+    """
+    blockchain.info haskoin-store API (mainnet only)
+    """
+    async def head(self) -> int:
+        return int((await self.get('head-block')).json()['height'])
+
+    async def get_address(self, address: BaseAddress) -> AddressInfo:
+        d = (await self.get('address', address=address.string)).json()
+        received = d['received'] - d['unconfirmed']
+        return AddressInfo(received, received - d['confirmed'], d['txs'], address)
+
+    async def get_transaction(self, txid: str) -> BroadcastedTransaction:
+        return self.process_transaction((await self.get('tx', txid=txid)).json())
+
+    async def get_transactions(self, txids: list[str]) -> list[BroadcastedTransaction]:
+        if not txids:
+            return []
+        r = await self.get('txs', {'params': {'txids': ','.join(txids)}}, handle_response=False)
+        if r.status_code == httpx.codes.BAD_REQUEST and 'Unable to parse param txids' in r.text:
+            raise NotFoundError(self, r)  # type: ignore
+        self.handle_response(r)
+        return self.collect(txids, map(self.process_transaction, r.json()), r)
+
+    async def get_address_transactions(
+        self,
+        address: BaseAddress,
+        length: int | None = None,
+        offset: int | None = None
+    ) -> list[BroadcastedTransaction]:
+        params = {k: v for k, v in [('limit', length), ('offset', offset)] if v is not None}
+        r = await self.get('atxs', {'params': params}, address=address.string)
+        return list(map(self.process_transaction, r.json()))
+
+    async def get_unspent(self, address: BaseAddress) -> list[Unspent]:
+        return [
+            Unspent(
+                bytes.fromhex(u['txid']),
+                u['index'],
+                u['value'],
+                u['block'].get('height', -1),
+                address
+            )
+            for u in (await self.get('utxo', address=address.string)).json()
+        ]
+
+    async def push(self, tx: RawTransaction) -> bool:
+        r = await self.post('push', {
+            'headers': {
+                'accept': 'application/json',
+                'Content-Type': 'text/plain'
+            },
+            'content': tx.serialize().hex()
+        }, handle_response=False)
+        self.handle_push_response(r)
+        return True
+
+
+class BlockchairAPI(ExplorerAPI, api.BlockchairAPI):
+    """
+    Blockchair dashboards API
+    """
+    batch: ClassVar[int] = 10  # max transactions per dashboards/transactions request
+    limitcodes: ClassVar[set[int]] = {httpx.codes.FORBIDDEN, httpx.codes.TOO_MANY_REQUESTS, 430}
+
+    async def head(self) -> int:
+        return int((await self.get('head-block')).json()['context']['state'])
+
+    async def get_address(self, address: BaseAddress) -> AddressInfo:
+        r = await self.get('address', address=address.string)
+        d = r.json()['data'][address.string]['address']
+        self.handle_address_notfound(d, r)
+        return AddressInfo(d['received'], d['spent'], d['transaction_count'], address)
+
+    async def get_transaction(self, txid: str) -> BroadcastedTransaction:
+        r = await self.get('tx', txid=txid)
+        if not (d := r.json()['data']):
+            raise NotFoundError(self, r)  # type: ignore
+        return self.process_transaction(d[txid])
+
+    async def get_transactions(self, txids: list[str]) -> list[BroadcastedTransaction]:
+        semaphore = asyncio.Semaphore(settings.EXPLORER_BATCH_CONCURRENCY)
+
+        async def get(chunk: list[str]) -> list[BroadcastedTransaction]:
+            async with semaphore:
+                r = await self.get('txs', txids=','.join(chunk), handle_response=False)
+            if r.status_code == httpx.codes.BAD_REQUEST:
+                raise NotFoundError(self, r)  # type: ignore
+            self.handle_response(r)
+            return self.collect(chunk, map(self.process_transaction, (r.json()['data'] or {}).values()), r)
+
+        chunks = await asyncio.gather(*(get(txids[i:i + self.batch]) for i in range(0, len(txids), self.batch)))
+        return [tx for chunk in chunks for tx in chunk]
+
+    async def get_address_transactions(
+        self,
+        address: BaseAddress,
+        length: int | None = None,
+        offset: int | None = None
+    ) -> list[BroadcastedTransaction]:
+        params = {
+            'limit': f'{length or settings.EXPLORER_HISTORY_PAGE_SIZE},0',
+            'offset': f'{offset or 0},0'
+        }
+        r = await self.get('address', {'params': params}, address=address.string)
+        d = r.json()['data'][address.string]
+        self.handle_address_notfound(d['address'], r)
+        return await self.get_transactions(d['transactions'])
+
+    async def get_unspent(self, address: BaseAddress, limit: int = 1000) -> list[Unspent]:
+        r = await self.get('address', {'params': {'limit': f'0,{limit}'}}, address=address.string)
+        d = r.json()['data'][address.string]
+        self.handle_address_notfound(d['address'], r)
+        return [
+            Unspent(bytes.fromhex(u['transaction_hash']), u['index'], u['value'], u['block_id'], address)
+            for u in d['utxo']
+        ]
+
+    async def push(self, tx: RawTransaction) -> bool:
+        r = await self.post('push', {'json': {self.pushing['param']: tx.serialize().hex()}}, handle_response=False)
+        self.handle_push_response(r)
+        return True
+
+
+EXPLORERS: list[type[ExplorerAPI]] = [BlockchainAPI, BlockstreamAPI, BlockchairAPI]
@@ -1,10 +1,17 @@
-from typing import Iterable, Sequence
-from sqlalchemy import select, update, delete, case, Select, tuple_
+import datetime
+from typing import Iterable, Sequence, NamedTuple, Any
+from sqlalchemy import (
+    select, update, delete, union, exists, and_, case, func, Select, Row, ColumnElement,
+    tuple_, bindparam, any_, literal, types
+)
 from sqlalchemy.orm import selectinload
-from sqlalchemy.dialects.postgresql import insert
-from btclib import BroadcastedTransaction, Unspent
+from sqlalchemy.dialects.postgresql import insert, aggregate_order_by, ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from btclib import BroadcastedTransaction, Unspent, NetworkType
 
-from ..database import SessionLocal
+from ..database import SessionLocal, engine
+from ..crud import chunked
+from ..config import settings
 from . import models
 
 
@@ -28,37 +35,83 @@ def select_transaction_statement(
 
 async def get_transaction(
     txid: bytes,
+    network: NetworkType,
     load_inout: bool = True,
     load_unspent: bool = True
-    # todo: network
 ) -> models.Transaction | None:
     q = select_transaction_statement(load_inout=load_inout, load_unspent=load_unspent).where(
+        models.Transaction.network == network,
         models.Transaction.id == txid
     )
     async with SessionLocal() as session:
         return (await session.scalars(q)).unique().one_or_none()
 
 
-async def find_transactions(
+async def get_serialized_transaction(
+    txid: bytes,
+    network: NetworkType,
+    amounts: bool = False
+) -> Row | None:
+    """
+    Read serialized transaction (and blockheight) by primary key, without inputs/outputs rows
+    :param amounts: also get inputs amounts (array ordered by index) needed to decode transaction
+    """
+    t, i = models.Transaction, models.Input
+    columns: list[Any] = [t.serialized, t.blockheight]
+    if amounts:
+        columns.append(
+            select(func.array_agg(aggregate_order_by(i.amount, i.index)))
+            .where(i.network == t.network, i.txid == t.id)
+            .scalar_subquery()
+            .label('amounts')
+        )
+    async with engine.connect() as conn:
+        return (await conn.execute(
+            select(*columns).where(t.network == network, t.id == txid)
+        )).one_or_none()
+
+
+type TransactionRows = tuple[Row, list[Row], list[Row]]  # transaction, inputs, outputs
+
+
+async def find_transactions_rows(
     txids: Iterable[bytes],
-    load_inout: bool = True,
-    load_unspent: bool = True
-    # todo: network
-) -> Sequence[models.Transaction]:
+    network: NetworkType
+) -> dict[bytes, TransactionRows]:
     """
-    Get cached transactions and pass those that don't exist
+    Get cached transactions (with inputs and outputs) as plain rows, without ORM
+    overhead, and pass those that don't exist. Txids are sent as a single array parameter
     """
-    q = select_transaction_statement(load_inout=load_inout, load_unspent=load_unspent).where(
-        models.Transaction.id.in_(txids)
-    )
-    async with SessionLocal() as session:
-        return (await session.scalars(q)).unique().all()  # fixme: session.scalars() is too slow
+    txids = bindparam('txids', list(txids), type_=ARRAY(types.LargeBinary))
+    tx, i, o = models.Transaction, models.Input, models.Output
+    async with engine.connect() as conn:
+        transactions = await conn.execute(
+            select(*(c for c in tx.__table__.columns if c.name not in ('serialized', 'created_at')))
+            .where(tx.network == network, tx.id == any_(txids))
+        )
+        r: dict[bytes, TransactionRows] = {row.id: (row, [], []) for row in transactions}
+        if not r:
+            return r
+
+        for index, q in [
+            (1, select(i.txid, i.outxid, i.vout, i.amount, i.is_segwit, i.is_coinbase, i.script, i.witness)
+                .where(i.network == network, i.txid == any_(txids))
+                .order_by(i.txid, i.index)),
+            (2, select(o.txid, o.pkscript, o.amount, o.address)
+                .where(o.network == network, o.txid == any_(txids))
+                .order_by(o.txid, o.vout))
+        ]:
+            for row in await conn.execute(q):
+                r[row.txid][index].append(row)
+        return r
 
 
 async def add_transaction(tx: BroadcastedTransaction, apiservice: str) -> models.Transaction:
     async with SessionLocal() as session, session.begin():
         txmodel = models.Transaction.from_instance(tx, apiservice)
         session.add(txmodel)
+        await session.flush()
+        await index_addresses(session, txmodel.network, [txmodel.id])
     return txmodel
 
 
@@ -66,87 +119,379 @@ async def add_transactions(
     transactions: list[BroadcastedTransaction],
     apiservice: str,
     *,
-    upsert: bool = False
+    upsert: bool = False,
+    address: str | None = None
 ) -> Iterable[models.Transaction]:
     """
     :param upsert: if false only add new transactions, if true resolve unique/pk conflict
                    with blockheight update
+    :param address: address whose history the transactions are (indexed for the address
+                    even if its previous outputs aren't cached)
     """
     async with SessionLocal() as session, session.begin():
         r = [models.Transaction.from_instance(tx, apiservice) for tx in transactions]
         if upsert:
-            for model in r:
-                stmt = insert(models.Transaction).values([tuple(model.values(exclude=['created_at']))])
-                if model.blockheight == -1:
-                    stmt = stmt.on_conflict_do_nothing()
-                else:
-                    stmt = stmt.on_conflict_do_update(
-                        index_elements=models.Transaction.__table__.primary_key,
-                        set_={
-                            'blockheight': model.blockheight
-                        },
-                    )
-
-                await session.execute(stmt)
-                for cls, io in [(models.Input, model.inputs), (models.Output, model.outputs)]:
-                    await session.execute(
-                        insert(cls)
-                        .values([tuple(object.values()) for object in io])
-                        .on_conflict_do_nothing()
-                    )
+            await bulk_upsert_transactions(session, r)
         else:
             session.add_all(r)
+            await session.flush()
+        for network in {m.network for m in r}:
+            txids = [m.id for m in r if m.network == network]
+            await index_addresses(session, network, txids)
+            if address:
+                await session.execute(
+                    insert(models.AddressTransaction)
+                    .values([dict(network=network, address=address, txid=txid) for txid in txids])
+                    .on_conflict_do_nothing()
+                )
         return r
 
 
-async def get_unspent(address: str) -> Iterable[models.Unspent]:
+async def index_addresses(session: AsyncSession, network: NetworkType, txids: list[bytes]) -> None:
+    """
+    Fill address to transaction index for transactions: addresses of their outputs, addresses
+    of cached outputs they spend, and transactions (already cached) that spend their outputs
+    """
+    txids = bindparam('txids', txids, type_=ARRAY(types.LargeBinary))
+    i, o = models.Input, models.Output
+    spends = and_(i.network == o.network, i.outxid == o.txid, i.vout == o.vout)
+    await session.execute(
+        insert(models.AddressTransaction)
+        .from_select(
+            ['network', 'address', 'txid'],
+            union(
+                select(o.network, o.address, o.txid)
+                .where(o.network == network, o.txid == any_(txids), o.address.is_not(None)),
+                select(i.network, o.address, i.txid).join(o, spends)
+                .where(i.network == network, i.txid == any_(txids), o.address.is_not(None)),
+                select(i.network, o.address, i.txid).join(o, spends)
+                .where(o.network == network, o.txid == any_(txids), o.address.is_not(None))
+            )
+        )
+        .on_conflict_do_nothing()
+    )
+
+
+async def count_address_transactions(address: str, network: NetworkType) -> tuple[int, int]:
+    """
+    :return: confirmed, unconfirmed cached address transactions
+    """
+    t, at = models.Transaction, models.AddressTransaction
+    async with engine.connect() as conn:
+        confirmed, unconfirmed = (await conn.execute(
+            select(
+                func.count().filter(t.blockheight != -1),
+                func.count().filter(t.blockheight == -1)
+            )
+            .select_from(at)
+            .join(t, and_(t.network == at.network, t.id == at.txid))
+            .where(at.network == network, at.address == address)
+        )).one()
+        return confirmed, unconfirmed
+
+
+def history_key(t: type[models.Transaction]) -> ColumnElement[int]:
+    """
+    Blockheight where unconfirmed transactions are the newest
+    """
+    return case((t.blockheight == -1, 2 ** 31 - 1), else_=t.blockheight)
+
+
+async def get_address_history(
+    address: str,
+    network: NetworkType,
+    length: int,
+    *,
+    offset: int | None = None,
+    after: bytes | None = None
+) -> list[TransactionRows] | None:
+    """
+    Cached address transactions, newest (unconfirmed) first. Paginated by offset or
+    by keyset (transactions after txid `after`)
+    :return: None if `after` isn't cached address transaction
+    """
+    t, at = models.Transaction, models.AddressTransaction
+    history = and_(at.network == t.network, at.txid == t.id, at.network == network, at.address == address)
+    q = (
+        select(t.id)
+        .join(at, history)
+        .order_by(history_key(t).desc(), t.id.desc())
+        .limit(length)
+    )
+    if offset:
+        q = q.offset(offset)
     async with SessionLocal() as session:
-        return (await session.scalars(
-            select(models.Unspent)
-            .where(models.Unspent.address == address)
-        )).all()
+        if after:
+            key = await session.scalar(select(history_key(t)).join(at, history).where(t.id == after))
+            if key is None:
+                return None
+            q = q.where(tuple_(history_key(t), t.id) < tuple_(
+                literal(key),
+                bindparam('after', after, type_=types.LargeBinary)
+            ))
+        txids = (await session.scalars(q)).all()
+    rows = await find_transactions_rows(txids, network)
+    return [rows[txid] for txid in txids if txid in rows]
+
+
+async def bulk_upsert_transactions(session: AsyncSession, txmodels: list[models.Transaction]) -> None:
+    """
+    Write transactions with their inputs and outputs using multi-row inserts, so the
+    number of statements doesn't depend on number of transactions. On transaction pk conflict
+    blockheight of unconfirmed row is updated if new one is confirmed, inputs/outputs conflicts are skipped
+    """
+    txmodels = list({(m.network, m.id): m for m in txmodels}.values())  # one row can't be affected twice
+
+    for rows in chunked([m.asdict(exclude=['created_at']) for m in txmodels]):
+        stmt = insert(models.Transaction).values(rows)
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=models.Transaction.__table__.primary_key,
+                set_={'blockheight': stmt.excluded.blockheight},
+                # only confirm cached unconfirmed, other conflicting rows are left untouched (no dead tuples)
+                where=and_(models.Transaction.blockheight == -1, stmt.excluded.blockheight != -1)
+            )
+        )
+
+    for cls, attr in [(models.Input, 'inputs'), (models.Output, 'outputs')]:
+        for rows in chunked([io.asdict() for m in txmodels for io in getattr(m, attr)]):
+            await session.execute(
+                insert(cls)
+                .values(rows)
+                .on_conflict_do_nothing()
+            )
+
+
+def unspent_clause(outputs: type[models.Output] | type[models.Unspent]) -> ColumnElement[bool]:
+    """
+    Output is not spent by any cached input (uses spend index)
+    """
+    return ~exists().where(
+        models.Input.network == outputs.network,
+        models.Input.outxid == outputs.txid,
+        models.Input.vout == outputs.vout
+    )
+
+
+async def get_unspent(address: str, network: NetworkType, derived: bool = False) -> Sequence[Row]:
+    """
+    Last explorer snapshot of address unspent. Outputs spent by cached transactions are excluded
+    :param derived: Join unspent outputs derived from cached transactions, only if all
+                    address transactions are cached (otherwise spent outputs can be derived
+                    as unspent, if spending transaction isn't cached)
+    """
+    return await find_unspent([address], network, [address] if derived else [])
 
 
-async def add_unspent(txid: bytes, vout: int, amount: int, addresstr: str) -> models.Unspent:
+async def find_unspent(addresses: list[str], network: NetworkType, derived: list[str] = []) -> Sequence[Row]:
+    """
+    Unspent of many addresses (see get_unspent), addresses are sent as an array parameter
+    :param derived: Addresses with complete cached history
+    """
+    u, o = models.Unspent, models.Output
+    q = (
+        select(u.txid, u.vout, u.amount, u.address)
+        .where(
+            u.network == network,
+            u.address == any_(bindparam('addresses', addresses, type_=ARRAY(types.String))),
+            unspent_clause(u)
+        )
+    )
+    if derived:
+        q = union(q, (
+            select(o.txid, o.vout, o.amount, o.address)
+            .where(
+                o.network == network,
+                o.address == any_(bindparam('derived', derived, type_=ARRAY(types.String))),
+                unspent_clause(o)
+            )
+        ))
+    async with engine.connect() as conn:
+        return (await conn.execute(q)).all()
+
+
+async def derive_address_info(address: str, network: NetworkType) -> tuple[int, int, int]:
+    """
+    Address stats derived from cached transactions, as complete as the cache is
+    :return: received, spent, tx count
+    """
+    o, i = models.Output, models.Input
+    async with engine.connect() as conn:
+        received, spent = (await conn.execute(
+            select(
+                func.coalesce(func.sum(o.amount), 0),
+                func.coalesce(func.sum(o.amount).filter(~unspent_clause(o)), 0)
+            )
+            .where(o.network == network, o.address == address)
+        )).one()
+        txcount = await conn.scalar(
+            select(func.count()).select_from(union(
+                select(o.txid).where(o.network == network, o.address == address),
+                select(i.txid).join(o, and_(
+                    i.network == o.network,
+                    i.outxid == o.txid,
+                    i.vout == o.vout
+                )).where(o.network == network, o.address == address)
+            ).subquery())
+        )
+    return received, spent, txcount or 0
+
+
+async def add_unspent(
+    txid: bytes,
+    vout: int,
+    amount: int,
+    addresstr: str,
+    network: NetworkType
+) -> models.Unspent:
     async with SessionLocal() as session, session.begin():
         u = models.Unspent(
+            network=network,
             txid=txid,
             vout=vout,
             amount=amount,
-            addresstr=addresstr
+            address=addresstr
         )
         session.add(u)
         return u
 
 
-async def put_unspent(addresstr: str, unspent: list[Unspent]) -> None:
+type Outpoint = tuple[bytes, int]  # txid, vout
+
+
+class UnspentDiff(NamedTuple):
+    added: list[Outpoint]
+    removed: list[Outpoint]
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed)
+
+
+async def put_unspent(addresstr: str, network: NetworkType, unspent: list[Unspent]) -> UnspentDiff:
+    """
+    :return: Added and removed outpoints, false if address unspent hasn't been changed
+    """
+    return (await put_unspents(network, {addresstr: unspent}))[addresstr]
+
+
+async def put_unspents(network: NetworkType, snapshots: dict[str, list[Unspent]]) -> dict[str, UnspentDiff]:
+    """
+    Replace unspent of addresses with new snapshots in one db transaction. Only the difference
+    with stored unspent is written, outpoints are sent as array parameters so the statements
+    have constant size regardless of the number of addresses and unspent
+    :param snapshots: {address string: address unspent}
+    """
+    snapshot = {(u.txid, u.vout): (addresstr, u) for addresstr, unspent in snapshots.items() for u in unspent}
     async with SessionLocal() as session, session.begin():
-        # delete those address unspent that are not in unspent list
-        await session.execute(
-            delete(models.Unspent)
+        stored: dict[str, set[Outpoint]] = {addresstr: set() for addresstr in snapshots}
+        for addresstr, txid, vout in await session.execute(
+            select(models.Unspent.address, models.Unspent.txid, models.Unspent.vout)
             .where(
-                models.Unspent.address == addresstr,
-                tuple_(models.Unspent.txid, models.Unspent.vout).not_in((u.txid, u.vout) for u in unspent)
+                models.Unspent.network == network,
+                models.Unspent.address == any_(bindparam(
+                    'addresses',
+                    list(snapshots),
+                    type_=ARRAY(types.String)
+                ))
             )
-        )
-        # add those unspent that are not in db
-        if unspent:
+            .with_for_update()
+        ):
+            stored[addresstr].add((txid, vout))
+
+        diffs = {
+            addresstr: UnspentDiff(
+                added=[(u.txid, u.vout) for u in unspent if (u.txid, u.vout) not in stored[addresstr]],
+                removed=[o for o in stored[addresstr] if o not in snapshot or snapshot[o][0] != addresstr]
+            )
+            for addresstr, unspent in snapshots.items()
+        }
+
+        if removed := [o for diff in diffs.values() for o in diff.removed]:
+            outpoints = func.unnest(
+                bindparam('txids', [txid for txid, _ in removed], type_=ARRAY(types.LargeBinary)),
+                bindparam('vouts', [vout for _, vout in removed], type_=ARRAY(types.BigInteger))
+            ).table_valued('txid', 'vout').render_derived()
+            await session.execute(
+                delete(models.Unspent)
+                .where(
+                    models.Unspent.network == network,
+                    models.Unspent.txid == outpoints.c.txid,
+                    models.Unspent.vout == outpoints.c.vout
+                )
+            )
+
+        if added := [snapshot[o] for diff in diffs.values() for o in diff.added]:
+            rows = func.unnest(
+                bindparam('txids', [u.txid for _, u in added], type_=ARRAY(types.LargeBinary)),
+                bindparam('vouts', [u.vout for _, u in added], type_=ARRAY(types.BigInteger)),
+                bindparam('amounts', [u.amount for _, u in added], type_=ARRAY(types.BigInteger)),
+                bindparam('addresses', [addresstr for addresstr, _ in added], type_=ARRAY(types.String))
+            ).table_valued('txid', 'vout', 'amount', 'address').render_derived()
             await session.execute(
                 insert(models.Unspent)
-                .values([(u.txid, u.vout, u.amount, u.address.string) for u in unspent])
+                .from_select(
+                    ['network', 'txid', 'vout', 'amount', 'address'],
+                    select(literal(network, models.Unspent.network.type), *rows.c)
+                )
                 .on_conflict_do_nothing()
             )
-    # second way
-    # async with SessionLocal() as session, session.begin():
-    #     await session.execute(delete(models.Unspent).where(models.Unspent.address == addresstr))
-    #     session.add_all(models.Unspent.from_instance(u) for u in unspent)
+        return diffs
 
 
-async def update_transactions_blockheight(heights: dict[bytes, int]):
+async def find_outputs_addresses(
+    outpoints: Iterable[tuple[bytes, int]],
+    network: NetworkType
+) -> set[str]:
+    """
+    Get addresses of cached outputs by (txid, vout)
+    """
+    if not (outpoints := list(outpoints)):
+        return set()
+    async with SessionLocal() as session:
+        return set((await session.scalars(
+            select(models.Output.address)
+            .where(
+                models.Output.network == network,
+                tuple_(models.Output.txid, models.Output.vout).in_(outpoints),
+                models.Output.address.is_not(None)
+            )
+        )).all())
+
+
+async def get_max_blockheight(network: NetworkType) -> int | None:
+    async with SessionLocal() as session:
+        return await session.scalar(
+            select(func.max(models.Transaction.blockheight))
+            .where(models.Transaction.network == network)
+        )
+
+
+async def get_unconfirmed_txids(network: NetworkType) -> Sequence[bytes]:
+    """
+    Unconfirmed transactions to reconcile, the ones cached longer than
+    EXPLORER_UNCONFIRMED_MAX_AGE ago are likely dropped from mempool and aren't polled
+    """
+    async with SessionLocal() as session:
+        return (await session.scalars(
+            select(models.Transaction.id)
+            .where(
+                models.Transaction.network == network,
+                models.Transaction.blockheight == -1,
+                models.Transaction.created_at > func.current_timestamp() - datetime.timedelta(
+                    seconds=settings.EXPLORER_UNCONFIRMED_MAX_AGE
+                )
+            )
+        )).all()
+
+
+async def update_transactions_blockheight(network: NetworkType, heights: dict[bytes, int]):
     async with SessionLocal() as session, session.begin():
         await session.execute(
             update(models.Transaction)
-            .where(models.Transaction.id.in_(heights.keys()))
+            .where(
+                models.Transaction.network == network,
+                models.Transaction.id.in_(heights.keys())
+            )
             .values(blockheight=case(
                 heights,
                 value=models.Transaction.id,
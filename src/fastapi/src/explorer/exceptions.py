@@ -15,6 +15,11 @@ class NotFoundError(HTTPException):
         super().__init__(status.HTTP_404_NOT_FOUND, msg)
 
 
+class CircuitOpenError(HTTPException):
+    def __init__(self):
+        super().__init__(status.HTTP_503_SERVICE_UNAVAILABLE, 'explorers are temporarily disabled')
+
+
 ExcessiveAddressError = HTTPException(status.HTTP_400_BAD_REQUEST, 'address is too excessive')
 ServiceUnavailableError = HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, 'explorers not available now')
 AddressNotFoundError = lambda a: NotFoundError('address', a.string)
@@ -1,19 +1,18 @@
-from typing import Annotated, Self, Iterable
+from typing import Self, Iterable, Any
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.orm import relationship
-from sqlalchemy import PrimaryKeyConstraint, types, ForeignKey
+from sqlalchemy import PrimaryKeyConstraint, ForeignKeyConstraint, Index, types, text
 import btclib
 
 from ..models import BaseModel, CreatedMixin, networkenum, bigint
 
 
-type txidFK = Annotated[
-    bytes,
-    mapped_column(ForeignKey(
-        'blockchain_transaction.id',
+def txFK(*columns: str) -> ForeignKeyConstraint:
+    return ForeignKeyConstraint(
+        columns,
+        ['blockchain_transaction.network', 'blockchain_transaction.id'],
         ondelete='CASCADE'
-    ))
-]
+    )
 
 
 class Base(BaseModel):
@@ -26,14 +25,22 @@ class Base(BaseModel):
             c.name
         ) for c in self.__table__.columns if noexclude or c.name not in exclude)
 
+    def asdict(self, *, exclude: Iterable[str] | None = None) -> dict[str, Any]:
+        noexclude = exclude is None
+        return {
+            c.name: getattr(self, c.name)
+            for c in self.__table__.columns if noexclude or c.name not in exclude
+        }
+
 
 class Input(Base):
     __tablename__ = 'blockchain_input'
 
-    txid: Mapped[txidFK] = mapped_column()
+    network: Mapped[networkenum] = mapped_column()
+    txid: Mapped[bytes] = mapped_column()
     index: Mapped[bigint] = mapped_column()
     outxid: Mapped[bytes] = mapped_column(types.LargeBinary(32))
-    vout: Mapped[bigint]
+    vout: Mapped[bigint] = mapped_column()
     amount: Mapped[bigint]
     is_segwit: Mapped[bool]
     is_coinbase: Mapped[bool]
@@ -43,30 +50,35 @@ class Input(Base):
     tx: Mapped['Transaction'] = relationship(back_populates='inputs')
 
     __table_args__ = (
-        PrimaryKeyConstraint(txid, index),
+        PrimaryKeyConstraint(network, txid, index),
+        txFK('network', 'txid'),
+        Index('ix_blockchain_input_network_outxid_vout', network, outxid, vout)  # spend index
     )
 
 
 class Output(Base):
     __tablename__ = 'blockchain_output'
 
-    txid: Mapped[txidFK] = mapped_column()
+    network: Mapped[networkenum] = mapped_column()
+    txid: Mapped[bytes] = mapped_column()
     vout: Mapped[bigint] = mapped_column()
     pkscript: Mapped[bytes]
     amount: Mapped[bigint]
-    address: Mapped[str | None]
+    address: Mapped[str | None] = mapped_column()
 
     tx: Mapped['Transaction'] = relationship(back_populates='outputs')
 
     __table_args__ = (
-        PrimaryKeyConstraint(txid, vout),
+        PrimaryKeyConstraint(network, txid, vout),
+        txFK('network', 'txid'),
+        Index('ix_blockchain_output_network_address', network, address)
     )
 
 
 class Transaction(Base, CreatedMixin):
     __tablename__ = 'blockchain_transaction'
 
-    id: Mapped[bytes] = mapped_column(types.LargeBinary(32), primary_key=True)
+    id: Mapped[bytes] = mapped_column(types.LargeBinary(32))
     inamount: Mapped[bigint]
     outamount: Mapped[bigint]
     incount: Mapped[int]
@@ -81,7 +93,7 @@ class Transaction(Base, CreatedMixin):
     fee: Mapped[bigint]
     blockheight: Mapped[int]
     serialized: Mapped[bytes]
-    network: Mapped[networkenum]
+    network: Mapped[networkenum] = mapped_column()
     apiservice: Mapped[str]
     # todo: add is_dropped for deleted blockchain transaction
 
@@ -89,12 +101,24 @@ class Transaction(Base, CreatedMixin):
     outputs: Mapped[list[Output]] = relationship(back_populates='tx')
     unspent: Mapped[list['Unspent']] = relationship(
         secondary='blockchain_output',
-        primaryjoin='Transaction.id == Output.txid',
-        secondaryjoin='and_(Output.txid == Unspent.txid, Output.vout == Unspent.vout)',
+        primaryjoin='and_(Transaction.network == Output.network, Transaction.id == Output.txid)',
+        secondaryjoin='and_(Output.network == Unspent.network, Output.txid == Unspent.txid, '
+                      'Output.vout == Unspent.vout)',
         back_populates='tx',
         viewonly=True
     )
 
+    __table_args__ = (
+        PrimaryKeyConstraint(network, id),
+        # unconfirmed transactions polled on every new block
+        Index(
+            'ix_blockchain_transaction_unconfirmed',
+            'network',
+            'created_at',
+            postgresql_where=text('blockheight = -1')
+        ),
+    )
+
     @classmethod
     def from_instance(cls, tx: btclib.BroadcastedTransaction, apiservice: str) -> Self:
         return cls(
@@ -118,6 +142,7 @@ class Transaction(Base, CreatedMixin):
 
             inputs=[
                 Input(
+                    network=tx.network,
                     txid=tx.id,
                     index=index,
                     outxid=inp.txid,
@@ -132,6 +157,7 @@ class Transaction(Base, CreatedMixin):
             ],
             outputs=[
                 Output(
+                    network=tx.network,
                     txid=tx.id,
                     vout=index,
                     **out.as_dict(hexadecimal=False)
@@ -141,33 +167,54 @@ class Transaction(Base, CreatedMixin):
         )
 
 
+class AddressTransaction(Base):
+    """
+    Address to transaction index, address is funded (output) or spent (input) by transaction
+    """
+    __tablename__ = 'blockchain_address_transaction'
+
+    network: Mapped[networkenum] = mapped_column()
+    address: Mapped[str] = mapped_column()
+    txid: Mapped[bytes] = mapped_column()
+
+    __table_args__ = (
+        PrimaryKeyConstraint(network, address, txid),
+        txFK('network', 'txid')
+    )
+
+
 class Unspent(Base):
     __tablename__ = 'blockchain_unspent'
 
+    network: Mapped[networkenum] = mapped_column()
     txid: Mapped[bytes] = mapped_column()
     vout: Mapped[int] = mapped_column()
     amount: Mapped[bigint] = mapped_column()
-    address: Mapped[str | None] = mapped_column(index=True)
+    address: Mapped[str | None] = mapped_column()
 
     tx: Mapped[Transaction | None] = relationship(
         secondary='blockchain_output',
-        primaryjoin='and_(Unspent.txid == Output.txid, Unspent.vout == Output.vout)',
-        secondaryjoin='Output.txid == Transaction.id',
+        primaryjoin='and_(Unspent.network == Output.network, Unspent.txid == Output.txid, '
+                    'Unspent.vout == Output.vout)',
+        secondaryjoin='and_(Output.network == Transaction.network, Output.txid == Transaction.id)',
         viewonly=True
     )
     output: Mapped[Output | None] = relationship(
         'Output',
-        primaryjoin='and_(Unspent.txid == Output.txid, Unspent.vout == Output.vout)',
-        foreign_keys=[txid, vout]
+        primaryjoin='and_(Unspent.network == Output.network, Unspent.txid == Output.txid, '
+                    'Unspent.vout == Output.vout)',
+        foreign_keys=[network, txid, vout]
     )
 
     __table_args__ = (
-        PrimaryKeyConstraint(txid, vout),
+        PrimaryKeyConstraint(network, txid, vout),
+        Index('ix_blockchain_unspent_network_address', network, address)
     )
 
     @classmethod
     def from_instance(cls, unspent: btclib.Unspent) -> Self:
         return cls(
+            network=unspent.address.network,
             txid=unspent.txid,
             vout=unspent.vout,
             amount=unspent.amount,
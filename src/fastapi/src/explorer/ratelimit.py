@@ -0,0 +1,92 @@
+import time
+import asyncio
+from abc import ABC, abstractmethod
+
+from redis import asyncio as aioredis
+
+from ..config import settings
+
+
+class RateLimited(Exception):
+    """
+    Token can't be taken before deadline
+    """
+
+
+class TokenBucket(ABC):
+    """
+    Allows `rate` requests per second with bursts up to `capacity` requests
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+
+    @abstractmethod
+    async def take(self) -> float:
+        """
+        Take a token
+        :return: 0 if token is taken, otherwise seconds until the next token
+        """
+
+    async def acquire(self, deadline: float) -> None:
+        """
+        Wait for a token (queue) until deadline (time.monotonic)
+        """
+        while wait := await self.take():
+            if time.monotonic() + wait > deadline:
+                raise RateLimited
+            await asyncio.sleep(wait)
+
+
+class LocalTokenBucket(TokenBucket):
+    """
+    Process-local bucket, every worker has its own quota
+    """
+    def __init__(self, rate: float, capacity: float):
+        super().__init__(rate, capacity)
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def take(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RedisTokenBucket(TokenBucket):
+    """
+    Bucket shared by all workers, refill and take are done atomically by lua script
+    """
+    script = '''
+        local rate, capacity = tonumber(ARGV[1]), tonumber(ARGV[2])
+        local t = redis.call('TIME')
+        local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+        local b = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = math.min(capacity, (tonumber(b[1]) or capacity) + (now - (tonumber(b[2]) or now)) * rate)
+        local wait = 0
+        if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+        redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+        return tostring(wait)
+    '''
+
+    def __init__(self, url: str, key: str, rate: float, capacity: float):
+        super().__init__(rate, capacity)
+        self.key = f'ratelimit:{key}'
+        self.take_script = aioredis.from_url(url).register_script(self.script)
+
+    async def take(self) -> float:
+        return float(await self.take_script(keys=[self.key], args=[self.rate, self.capacity]))
+
+
+def create(key: str, rate: float, capacity: float) -> TokenBucket:
+    """
+    Bucket shared between workers if CACHE_REDIS_URL is set, process-local otherwise
+    """
+    if settings.CACHE_REDIS_URL:
+        return RedisTokenBucket(settings.CACHE_REDIS_URL, key, rate, capacity)
+    return LocalTokenBucket(rate, capacity)
@@ -1,9 +1,12 @@
-from typing import Self
+import base64
+from typing import Self, Iterable
+from sqlalchemy import Row
 from functools import cached_property
 from pydantic import computed_field,  BaseModel, Field, ConfigDict, ValidationError, model_validator
 import btclib
 
 from ..schema import hexstring
+from ..config import settings
 from . import models
 
 
@@ -26,6 +29,27 @@ class GetAddressTransactionsInput(BaseModel):
         return self
 
 
+class HistoryCursor(BaseModel):
+    """
+    Position in address history. Both offset (blockchain.com) and last transaction
+    (blockstream.info, db keyset) are kept, so client doesn't depend on the network.
+    Source of the history (db or explorer) is kept too, so it isn't mixed while paging
+    """
+    offset: int = Field(default=0, ge=0)
+    txid: hexstring.length64 | None = None
+    local: bool | None = None
+
+    def encode(self) -> str:
+        return base64.urlsafe_b64encode(self.model_dump_json(exclude_defaults=True).encode()).decode()
+
+    @classmethod
+    def decode(cls, cursor: str) -> Self:
+        try:
+            return cls.model_validate_json(base64.urlsafe_b64decode(cursor))
+        except ValueError:
+            raise ValueError('invalid cursor')
+
+
 class Base(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
@@ -69,6 +93,9 @@ class Output(Base):
     address: str | None
 
 
+# from_* constructors of transactions and unspent are used for trusted data (our db
+# or btclib), models are built with model_construct without validation and hex strings
+# are encoded in place
 class Transaction(Base):
     id: hexstring.length64
     inamount: int
@@ -87,7 +114,16 @@ class Transaction(Base):
 
     @classmethod
     def from_model(cls, model: models.Transaction) -> Self:
-        return cls.model_validate(model)
+        return cls.model_construct(**cls.fields_from(model))
+
+    @classmethod
+    def fields_from(cls, object: models.Transaction | Row) -> dict:
+        """
+        Transaction fields of db model/row
+        """
+        fields = {name: getattr(object, name) for name in Transaction.model_fields}
+        fields['id'] = fields['id'].hex()
+        return fields
 
 
 class TransactionDetail(Transaction):
@@ -96,7 +132,7 @@ class TransactionDetail(Transaction):
 
     @classmethod
     def from_instance(cls, instance: btclib.BroadcastedTransaction) -> Self:
-        return cls(
+        return cls.model_construct(
             id=instance.id.hex(),
             inamount=instance.inputs.amount,
             outamount=instance.outputs.amount,
@@ -112,53 +148,55 @@ class TransactionDetail(Transaction):
             fee=instance.fee,
             blockheight=instance.block,
             inputs=[
-                Input(
-                    txid=i.txid,  # type: ignore
+                Input.model_construct(
+                    txid=i.txid.hex(),
                     vout=i.vout,
                     amount=i.amount,
                     is_segwit=bool(i.witness),
                     is_coinbase=isinstance(i, btclib.CoinbaseInput),
-                    script=i.script.serialize(),  # type: ignore
-                    witness=i.witness.serialize(segwit=True)  # type: ignore
+                    script=i.script.serialize().hex(),
+                    witness=i.witness.serialize(segwit=True).hex()
                 )
                 for i in instance.inputs
             ],
             outputs=[
-                Output(**o.as_dict())
+                Output.model_construct(**o.as_dict())
                 for o in instance.outputs
             ]
         )
 
     @classmethod
     def from_model(cls, model: models.Transaction) -> Self:
-        return cls(
-            id=model.id,  # type: ignore
-            inamount=model.inamount,
-            outamount=model.outamount,
-            incount=model.incount,
-            outcount=model.outcount,
-            version=model.version,
-            locktime=model.locktime,
-            size=model.size,
-            vsize=model.vsize,
-            weight=model.weight,
-            is_segwit=model.is_segwit,
-            is_coinbase=model.is_coinbase,
-            fee=model.fee,
-            blockheight=model.blockheight,
+        return cls.from_rows(model, model.inputs, model.outputs)
+
+    @classmethod
+    def from_rows(
+        cls,
+        tx: Row | models.Transaction,
+        inputs: Iterable[Row | models.Input],
+        outputs: Iterable[Row | models.Output]
+    ) -> Self:
+        """
+        Build from crud.find_transactions_rows result (or from db model)
+        """
+        return cls.model_construct(
+            **cls.fields_from(tx),
             inputs=[
-                Input(
-                    txid=i.outxid,  # type: ignore
+                Input.model_construct(
+                    txid=i.outxid.hex(),
                     vout=i.vout,
                     amount=i.amount,
                     is_segwit=i.is_segwit,
                     is_coinbase=i.is_coinbase,
-                    script=i.script,  # type: ignore
-                    witness=i.witness  # type: ignore
+                    script=i.script.hex(),
+                    witness=i.witness.hex()
                 )
-                for i in model.inputs
+                for i in inputs
             ],
-            outputs=[Output.model_validate(o) for o in model.outputs]
+            outputs=[
+                Output.model_construct(pkscript=o.pkscript.hex(), amount=o.amount, address=o.address)
+                for o in outputs
+            ]
         )
 
 
@@ -172,9 +210,9 @@ class Unspent(Base):
     )
 
     @classmethod
-    def _from_object(cls, object: btclib.Unspent | models.Unspent, address: str | None):
-        return cls(
-            txid=object.txid,  # type: ignore
+    def _from_object(cls, object: btclib.Unspent | models.Unspent | Row, address: str | None):
+        return cls.model_construct(
+            txid=object.txid.hex(),
             vout=object.vout,
             amount=object.amount,
             address=address
@@ -185,7 +223,7 @@ class Unspent(Base):
         return cls._from_object(unspent, unspent.address.string)
 
     @classmethod
-    def from_model(cls, unspent: models.Unspent) -> Self:
+    def from_model(cls, unspent: models.Unspent | Row) -> Self:
         return cls._from_object(unspent, unspent.address)
 
     def model_dump(self, *args, **kwargs):
@@ -198,5 +236,26 @@ class TransactionUnspent(BaseModel):
     unspent: list[Unspent]
 
 
+class AddressUnspent(BaseModel):
+    address: str
+    unspent: list[TransactionUnspent] | list[Unspent]
+
+
+class GetUnspentBatchInput(BaseModel):
+    addresses: list[str] = Field(min_length=1, max_length=settings.EXPLORER_BATCH_MAX_ADDRESSES)
+    network: btclib.NetworkType = btclib.NetworkType.MAIN
+    include_transaction: bool = True
+
+    @cached_property
+    def instances(self) -> list[btclib.BaseAddress]:
+        return [btclib.address.from_string(a) for a in dict.fromkeys(self.addresses)]
+
+    @model_validator(mode='after')
+    def validateaddresses(self) -> Self:
+        for a in self.instances:
+            btclib.address.validateaddr(a, None, self.network)
+        return self
+
+
 class BroadcastTransactionInput(BaseModel):
     serialized: hexstring.notempty
@@ -1,128 +1,448 @@
 import time
-from typing import Iterable, overload, Callable, Any, Literal
+import asyncio
+import inspect
+import secrets
+import functools
+from collections import deque
+from contextvars import ContextVar
+from typing import overload, Any, Literal, Callable, Awaitable, AsyncIterator
 
 import httpx
-from anyio import to_thread
 from fastapi import status, HTTPException
-from btclib import NetworkType, Unspent, Service as API
+from btclib import NetworkType, Unspent
 from btclib.address import BaseAddress
-from btclib.service import DEFAULT_SERVICE_TIMEOUT, AddressInfo, NotFoundError,\
-                           ExplorerError, ExcessiveAddress, AddressOverflowError, \
-                           BlockchainAPI, BlockstreamAPI, ExplorerAPI
+from btclib.service import AddressInfo
 from btclib.transaction import RawTransaction, BroadcastedTransaction
 
-from . import crud, models, schema, exceptions as exc
+from . import client, crud, schema, exceptions as exc
+from .client import ExplorerAPI, ExplorerError, BlockchainAPI, BlockstreamAPI
+from .tracker import ChainTipTracker
+from .breaker import CircuitBreaker, CircuitOpen
+from .ratelimit import RateLimited
 from ..config import settings
+from .. import cache
+
+
+addresscache = cache.create(
+    'explorer:address',
+    settings.EXPLORER_ADDRESS_CACHE_SIZE,
+    settings.EXPLORER_ADDRESS_CACHE_TTL
+)
+
+
+UPSTREAM_ERRORS = (ExplorerError, httpx.TimeoutException, httpx.TransportError, ValueError, KeyError, CircuitOpen, RateLimited)
+ANSWER_ERRORS = (client.NotFoundError, client.TransactionRejected, *client.EXCESSIVE_ADDRESS_ERRORS)  # explorer is alive and answered
+
+
+class ExplorerStats:
+    """
+    Exponentially weighted moving average of explorer response time and error rate
+    """
+    def __init__(self, alpha: float, samples: int = 100):
+        self.alpha = alpha
+        self.minsamples = samples // 5
+        self.latency: float | None = None
+        self.errors = 0.0
+        self.samples: deque[float] = deque(maxlen=samples)  # recent successful response times
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.errors += self.alpha * ((not ok) - self.errors)
+        if ok:
+            self.samples.append(latency)
+            self.latency = latency if self.latency is None else self.latency + self.alpha * (latency - self.latency)
+
+    def record_cancelled(self, elapsed: float) -> None:
+        """
+        Request was cancelled (lost hedge race) after elapsed seconds, so its latency is at least
+        elapsed. It's only informative (and recorded) if it's above current estimate
+        """
+        if self.latency is None or elapsed > self.latency:
+            self.samples.append(elapsed)
+            self.latency = elapsed if self.latency is None else self.latency + self.alpha * (elapsed - self.latency)
+
+    @property
+    def score(self) -> float:
+        """
+        Lower is better, explorer without statistics goes first to get it
+        """
+        if self.latency is None:
+            return 0
+        return self.latency * (1 + 10 * self.errors)
+
+    def percentile(self, q: float) -> float | None:
+        if len(self.samples) < self.minsamples:
+            return None
+        return sorted(self.samples)[int(q * (len(self.samples) - 1))]
+
+
+class ExplorerRouter:
+    """
+    Routes requests to the fastest healthy explorer (per explorer class and network).
+    Explorers with open circuit breaker are skipped
+    """
+    def __init__(self, alpha: float, hedge_percentile: float):
+        self.alpha = alpha
+        self.hedge_percentile = hedge_percentile
+        self.stats: dict[tuple[type[ExplorerAPI], NetworkType], ExplorerStats] = {}
+        self.breakers: dict[tuple[type[ExplorerAPI], NetworkType], CircuitBreaker] = {}
+
+    def get(self, explorer: ExplorerAPI) -> ExplorerStats:
+        key = (type(explorer), explorer.network)
+        if not (stats := self.stats.get(key)):
+            stats = self.stats[key] = ExplorerStats(self.alpha)
+        return stats
+
+    def breaker(self, explorer: ExplorerAPI) -> CircuitBreaker:
+        key = (type(explorer), explorer.network)
+        if not (breaker := self.breakers.get(key)):
+            breaker = self.breakers[key] = CircuitBreaker(
+                settings.EXPLORER_BREAKER_THRESHOLD,
+                settings.EXPLORER_BREAKER_RESET_TIMEOUT,
+                settings.EXPLORER_BREAKER_PROBES
+            )
+        return breaker
+
+    def order(self, explorers: list[ExplorerAPI]) -> list[ExplorerAPI]:
+        return sorted(
+            (e for e in explorers if self.breaker(e).available),
+            key=lambda e: self.get(e).score
+        )
+
+    def record(self, explorer: ExplorerAPI, latency: float, ok: bool) -> None:
+        self.get(explorer).record(latency, ok)
+        breaker = self.breaker(explorer)
+        if ok:
+            breaker.success()
+        else:
+            breaker.failure()
+
+    def hedge_delay(self, explorer: ExplorerAPI) -> float | None:
+        """
+        Time after which a hedged request to the next explorer is sent (None - don't hedge)
+        """
+        return self.get(explorer).percentile(self.hedge_percentile)
+
+
+router = ExplorerRouter(settings.EXPLORER_LATENCY_EWMA_ALPHA, settings.EXPLORER_HEDGE_PERCENTILE)
 
 
 class Service:
-    httpx_client = httpx.Client(follow_redirects=True, timeout=DEFAULT_SERVICE_TIMEOUT)
+    idempotent = {'head', 'get_address', 'get_address_transactions', 'get_transactions', 'get_transaction', 'get_unspent'}
 
     def __init__(self, network: NetworkType, handle_explorer_error: bool = True):
-        self.api = API(network=network, client=self.httpx_client)
+        self.network = network
+        self.explorers = [cls(network) for cls in client.EXPLORERS if cls.supports_network(network)]
+        self.previous_explorer: ExplorerAPI | None = None
         self.handle_explorer_error = handle_explorer_error
 
     @property
     def previous_apiservice(self) -> str:
-        return getattr(self.api.previous_explorer, '__name__', '')
+        return type(self.previous_explorer).__name__ if self.previous_explorer else ''
 
-    async def send[T](
+    async def call(
+        self,
+        explorer: ExplorerAPI,
+        method: str,
+        args: tuple,
+        kwargs: dict[str, Any]
+    ) -> tuple[ExplorerAPI, Any]:
+        if not router.breaker(explorer).acquire():
+            raise CircuitOpen
+        start = time.monotonic()
+        try:
+            r = await getattr(explorer, method)(*args, **kwargs)
+        except asyncio.CancelledError:
+            router.breaker(explorer).release()
+            router.get(explorer).record_cancelled(time.monotonic() - start)
+            raise
+        except RateLimited:
+            # our own quota is exhausted, it says nothing about explorer health
+            router.breaker(explorer).release()
+            raise
+        except ANSWER_ERRORS:
+            router.record(explorer, time.monotonic() - start, ok=True)
+            raise
+        except UPSTREAM_ERRORS:
+            router.record(explorer, time.monotonic() - start, ok=False)
+            raise
+        except BaseException:
+            # unexpected error isn't explorer health, but probe slot mustn't stay taken
+            router.breaker(explorer).release()
+            raise
+        router.record(explorer, time.monotonic() - start, ok=True)
+        return explorer, r
+
+    async def race(
         self,
-        f: Callable[..., T],
+        explorers: list[ExplorerAPI],
+        method: str,
+        args: tuple,
+        kwargs: dict[str, Any]
+    ) -> tuple[ExplorerAPI, Any]:
+        """
+        Call first explorer, if it doesn't respond in time (hedge delay) or fails - call
+        second one too. Returns first successful response
+        """
+        primary = asyncio.ensure_future(self.call(explorers[0], method, args, kwargs))
+        tasks = [primary]
+        try:
+            if len(explorers) > 1:
+                await asyncio.wait(tasks, timeout=router.hedge_delay(explorers[0]))
+                if not primary.done() or (
+                    (e := primary.exception()) and not isinstance(e, ANSWER_ERRORS)
+                ):
+                    tasks.append(asyncio.ensure_future(self.call(explorers[1], method, args, kwargs)))
+
+            errors: list[Exception] = []
+            for future in asyncio.as_completed(tasks):
+                try:
+                    return await future
+                except UPSTREAM_ERRORS as e:
+                    errors.append(e)
+            # explorer answer is preferred to unavailability, unavailability to breaker rejection
+            raise next((e for e in errors if isinstance(e, ANSWER_ERRORS)), None) \
+                or next((e for e in errors if not isinstance(e, CircuitOpen)), errors[0])
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def send(
+        self,
+        method: str,
         *args,
         notfounderr: exc.NotFoundError | None = None,
-        serviceins: ExplorerAPI | None = None,
+        explorers: list[ExplorerAPI] | None = None,
         kwargs: dict[str, Any] = {}
-    ) -> T:
-        try:
-            r = await to_thread.run_sync(
-                f,
-                serviceins if serviceins else self.api,
-                *args,
-                **kwargs
-            )
-
-        except (ExcessiveAddress, AddressOverflowError):
-            raise exc.ExcessiveAddressError
-
-        except NotFoundError:
-            raise notfounderr or exc.NotFoundError()
-
-        except (ExplorerError, httpx.TimeoutException, ConnectionError) as e:
-            if isinstance(e, ExplorerError) and not self.handle_explorer_error:
-                raise e
-            else:
-                raise exc.ServiceUnavailableError
-
-        return r
+    ) -> Any:
+        """
+        Call explorer method on the fastest healthy explorer, rotating to the next one if
+        it is unavailable. Idempotent calls are hedged (see Service.race) if enabled
+        """
+        if not (explorers := router.order(explorers or self.explorers)):
+            raise exc.CircuitOpenError()
+        step = 2 if settings.EXPLORER_HEDGING and method in self.idempotent else 1
+        error: ExplorerError | None = None
+        rejected = True  # all explorers were rejected by breakers (concurrent half-open probes)
+        for i in range(0, len(explorers), step):
+            try:
+                explorer, r = await self.race(explorers[i:i + step], method, args, kwargs)
+
+            except client.EXCESSIVE_ADDRESS_ERRORS:
+                raise exc.ExcessiveAddressError
+
+            except client.NotFoundError:
+                raise notfounderr or exc.NotFoundError()
+
+            except client.TransactionRejected:
+                raise  # another explorer would reject it too
+
+            except CircuitOpen:
+                continue
+
+            except ExplorerError as e:
+                error, rejected = e, False
+                continue
+
+            except UPSTREAM_ERRORS:
+                rejected = False
+                continue
+
+            self.previous_explorer = explorer
+            return r
+
+        if rejected:
+            raise exc.CircuitOpenError()
+        if error and not self.handle_explorer_error:
+            raise error
+        raise exc.ServiceUnavailableError
 
     async def get_head_blockheight(self) -> int:
-        return await self.send(API.head)
+        return await self.send('head')
 
     async def get_address(self, address: BaseAddress) -> AddressInfo:
         return await self.send(
-            API.get_address,
+            'get_address',
             address,
             notfounderr=exc.AddressNotFoundError(address)
         )
 
     async def get_address_transactions(self, address: BaseAddress) -> list[BroadcastedTransaction]:
         return await self.send(
-            API.get_address_transactions,
+            'get_address_transactions',
             address,
             notfounderr=exc.AddressNotFoundError(address)
         )
 
     async def get_transactions(self, txids: list[str]) -> list[BroadcastedTransaction]:
         return await self.send(
-            API.get_transactions,
+            'get_transactions',
             txids,
             notfounderr=exc.TransactionsNotFoundError(txids)
         )
 
     async def get_transaction(self, txid: str) -> BroadcastedTransaction:
         return await self.send(
-            API.get_transaction,
+            'get_transaction',
             txid,
             notfounderr=exc.TransactionNotFoundError(txid)
         )
 
     async def get_unspent(self, address: BaseAddress) -> list[Unspent]:
         return await self.send(
-            API.get_unspent,
+            'get_unspent',
             address,
             notfounderr=exc.AddressNotFoundError(address)
         )
 
     async def push(self, tx: RawTransaction) -> Literal[True]:
         return await self.send(
-            API.push,
+            'push',
             tx
         )
 
 
-def _getheadcache(foo):
-    cache: dict[NetworkType, tuple[float, schema.HeadBlock]] = {}
-    async def inner(network: NetworkType) -> schema.HeadBlock:
-        timestamp, head = cache.get(network, (0, None))
-        print(timestamp + settings.EXPLORER_HEAD_BLOCK_CACHE_TTL, time.time())
-        if timestamp + settings.EXPLORER_HEAD_BLOCK_CACHE_TTL < time.time() or not head:
-            print('update cache')
-            head = await foo(network)
-            cache[network] = (time.time(), head)
-        return head
+def _singleflight[**P, T](foo: Callable[P, Awaitable[T]]) -> Callable[P, Awaitable[T]]:
+    """
+    Coalesce concurrent identical calls: while a call keyed by (operation, network, arguments)
+    is in flight, next callers await its result instead of hitting explorer/db again
+    """
+    inflight: dict[tuple, asyncio.Future[T]] = {}
+    signature = inspect.signature(foo)
+
+    def arg(a: Any) -> Any:
+        return (a.network, a.string) if isinstance(a, BaseAddress) else a
+
+    @functools.wraps(foo)
+    async def inner(*args: P.args, **kwargs: P.kwargs) -> T:
+        # the same call made positionally, by keyword or with omitted defaults has the same key
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = (foo.__name__, *((k, arg(v)) for k, v in bound.arguments.items()))
+        if not (future := inflight.get(key)):
+            future = inflight[key] = asyncio.ensure_future(foo(*args, **kwargs))
+            future.add_done_callback(lambda _: inflight.pop(key, None))
+        # shield shared call from cancellation of a single caller
+        return await asyncio.shield(future)
     return inner
 
 
-@_getheadcache
+chaintip = ChainTipTracker(
+    lambda network: Service(network).get_head_blockheight(),
+    settings.EXPLORER_HEAD_POLL_INTERVAL
+)
+
+
+# set when response is built from cached data because explorers are disabled by circuit breakers
+stale: ContextVar[bool] = ContextVar('stale', default=False)
+
+
 async def gethead(network: NetworkType) -> schema.HeadBlock:
-    blockheight = await Service(network).get_head_blockheight()
-    return schema.HeadBlock(blockheight=blockheight)
+    try:
+        return schema.HeadBlock(blockheight=await chaintip.height(network))
+    except exc.CircuitOpenError:
+        # the highest cached block
+        if (blockheight := await crud.get_max_blockheight(network)) is None:
+            raise
+        stale.set(True)
+        return schema.HeadBlock(blockheight=blockheight)
+
+
+_reconciling: set[NetworkType] = set()
+
+
+@chaintip.subscribe
+async def reconcile_confirmations(network: NetworkType, height: int) -> None:
+    """
+    Update blockheight of cached unconfirmed transactions when a new block arrives
+    """
+    if network in _reconciling:
+        return
+    _reconciling.add(network)
+    try:
+        txids = [txid.hex() for txid in await crud.get_unconfirmed_txids(network)]
+        service = Service(network)
+        heights: dict[bytes, int] = {}
+
+        for i in range(0, len(txids), settings.EXPLORER_RECONCILE_BATCH_SIZE):
+            batch = txids[i:i + settings.EXPLORER_RECONCILE_BATCH_SIZE]
+            try:
+                fetched = await service.get_transactions(batch)
+            except exc.NotFoundError:
+                # some of transactions are dropped, resolve them one by one
+                fetched = [
+                    tx for tx in await asyncio.gather(
+                        *map(service.get_transaction, batch),
+                        return_exceptions=True
+                    ) if isinstance(tx, BroadcastedTransaction)
+                ]
+            except HTTPException:
+                break  # explorers are unavailable, save what is resolved
+            heights.update((tx.id, tx.block) for tx in fetched if tx.block != -1)
+
+        if heights:
+            await crud.update_transactions_blockheight(network, heights)
+    finally:
+        _reconciling.discard(network)
+
+
+async def _addresskey(address: BaseAddress) -> str:
+    """
+    Address cache keys prefix. It contains address version which is dropped on invalidation,
+    so all address keys (info, transactions pages) become unreachable at once
+    """
+    vkey = f'{address.network.value}:{address.string}'
+    if not (version := await addresscache.get(vkey)):
+        version = secrets.token_hex(8)
+        await addresscache.set(vkey, version)
+    return f'{vkey}:{version}'
+
+
+async def invalidate_address(network: NetworkType, *addresses: str) -> None:
+    await addresscache.delete(*(f'{network.value}:{a}' for a in addresses))
 
 
 async def getaddrinfo(address: BaseAddress) -> schema.AddressInfo:
-    inf = await Service(address.network).get_address(address)
-    return schema.AddressInfo.from_instance(inf)
+    try:
+        return await fetch_address_info(address)
+    except exc.CircuitOpenError:
+        # derive from cached transactions
+        received, spent, txcount = await crud.derive_address_info(address.string, address.network)
+        if not txcount:
+            raise
+        stale.set(True)
+        return schema.AddressInfo(
+            address=address.string,
+            received=received,
+            spent=spent,
+            tx_count=txcount,
+            network=address.network
+        )
+
+
+async def fetch_address_info(address: BaseAddress) -> schema.AddressInfo:
+    key = await _addresskey(address) + ':info'
+    if not (inf := await addresscache.get(key)):
+        inf = schema.AddressInfo.from_instance(await Service(address.network).get_address(address))
+        await addresscache.set(key, inf)
+    return inf
+
+
+async def is_history_complete(address: BaseAddress, fetch: bool = True) -> bool:
+    """
+    All address transactions are cached and confirmed (cached unconfirmed ones can be dropped
+    or replaced), compared with explorer transactions count
+    :param fetch: Request address info from explorer if it isn't cached, otherwise history
+                  is considered incomplete (for reads answered from db only)
+    """
+    if fetch:
+        try:
+            inf = await fetch_address_info(address)
+        except HTTPException:
+            return False
+    elif not (inf := await addresscache.get(await _addresskey(address) + ':info')):
+        return False
+    confirmed, unconfirmed = await crud.count_address_transactions(address.string, address.network)
+    return not unconfirmed and confirmed == inf.tx_count
 
 
 @overload
@@ -147,14 +467,40 @@ async def get_or_add_transaction(
     cached: bool,
     detail: bool
 ) -> schema.Transaction | schema.TransactionDetail:
-    tx = await crud.get_transaction(txid, load_inout=detail, load_unspent=False)
+    try:
+        return await _get_or_add_transaction(txid, network, cached, detail)
+    except exc.CircuitOpenError:
+        # return cached transaction without blockheight update
+        if not (tx := await crud.get_transaction(txid, network, load_inout=detail, load_unspent=False)):
+            raise
+        stale.set(True)
+        cls = schema.TransactionDetail if detail else schema.Transaction
+        return cls.from_model(tx)
+
+
+@_singleflight
+async def _get_or_add_transaction(
+    txid: bytes,
+    network: NetworkType,
+    cached: bool,
+    detail: bool
+) -> schema.Transaction | schema.TransactionDetail:
+    if detail and settings.EXPLORER_TRANSACTION_DECODE:
+        # decode serialized instead of loading inputs and outputs
+        row = await crud.get_serialized_transaction(txid, network, amounts=True)
+        if row and row.amounts and (row.blockheight != -1 or cached):
+            return schema.TransactionDetail.from_instance(
+                BroadcastedTransaction.deserialize(row.serialized, row.amounts, row.blockheight, network)
+            )
+
+    tx = await crud.get_transaction(txid, network, load_inout=detail, load_unspent=False)
 
     if not tx or tx.blockheight == -1 and not cached:
         service = Service(network)
         broadcasted = await service.get_transaction(txid.hex())
         if tx:
             if tx.blockheight != broadcasted.block:
-                await crud.update_transactions_blockheight({txid: broadcasted.block})
+                await crud.update_transactions_blockheight(network, {txid: broadcasted.block})
                 tx.blockheight = broadcasted.block
 
         else:
@@ -167,41 +513,172 @@ async def get_or_add_transaction(
     return cls.from_model(tx)
 
 
+async def get_raw_transaction(txid: bytes, network: NetworkType) -> bytes:
+    if row := await crud.get_serialized_transaction(txid, network):
+        return row.serialized
+
+    service = Service(network)
+    tx = await service.get_transaction(txid.hex())
+    await crud.add_transactions([tx], service.previous_apiservice, upsert=True)
+    return tx.serialize()
+
+
 async def get_address_transactions(
     address: BaseAddress,
     length: int | None,
     offset: int | None,
     last_seen_txid: str | None
-) -> Iterable[schema.TransactionDetail]:
+) -> list[schema.TransactionDetail]:
+    key = await _addresskey(address) + f':transactions:{length}:{offset}:{last_seen_txid}'
+    if (page := await addresscache.get(key)) is not None:
+        return page
+
+    rows = None
+    if await is_history_local(address):
+        # None if last_seen_txid isn't cached, it's from explorer's page then
+        rows = await crud.get_address_history(
+            address.string,
+            address.network,
+            length or settings.EXPLORER_HISTORY_PAGE_SIZE,
+            offset=offset,
+            after=bytes.fromhex(last_seen_txid) if last_seen_txid else None
+        )
+    if rows is not None:
+        page = [schema.TransactionDetail.from_rows(*r) for r in rows]
+    else:
+        page = list(map(
+            schema.TransactionDetail.from_instance,
+            await fetch_address_transactions(address, length, offset, last_seen_txid)
+        ))
+    await addresscache.set(key, page)
+    return page
+
+
+async def fetch_address_transactions(
+    address: BaseAddress,
+    length: int | None,
+    offset: int | None,
+    last_seen_txid: str | None
+) -> list[BroadcastedTransaction]:
+    """
+    Get page of address transactions from explorer and cache (and index) them
+    """
     service = Service(address.network)
     if address.network is NetworkType.MAIN:
         r = {
             'cls': BlockchainAPI,
-            'func': BlockchainAPI.get_address_transactions,
             'args': [length, offset]
         }
     else:
         r = {
             'cls': BlockstreamAPI,
-            'func': BlockstreamAPI.get_address_transactions,
             'args': [last_seen_txid]
         }
     transactions = await service.send(
-        r['func'],
+        'get_address_transactions',
         address,
-        *(a for a in r['args'] if a is not None),
+        *r['args'],
         notfounderr=exc.AddressNotFoundError(address),
-        serviceins=r['cls'](address.network)
+        explorers=[r['cls'](address.network)]
+    )
+    await crud.add_transactions(
+        transactions,
+        service.previous_apiservice,
+        upsert=True,
+        address=address.string
     )
-    await crud.add_transactions(transactions, service.previous_apiservice, upsert=True)
-    return map(schema.TransactionDetail.from_instance, transactions)
+    return transactions
+
+
+async def stream_address_transactions(
+    address: BaseAddress,
+    cursor: schema.HistoryCursor,
+    length: int | None
+) -> AsyncIterator[str]:
+    """
+    Address transactions as NDJSON lines, sent page by page as they are read from db or
+    fetched from explorer. Up to EXPLORER_STREAM_MAX_LENGTH transactions (explorer pages aren't
+    cut, so last one can exceed length), last line is {"cursor": next cursor or null}
+    """
+    length = min(length or settings.EXPLORER_STREAM_MAX_LENGTH, settings.EXPLORER_STREAM_MAX_LENGTH)
+    local = await is_history_local(address) if cursor.local is None else cursor.local
+    while length > 0:
+        size = min(settings.EXPLORER_HISTORY_PAGE_SIZE, length)
+        rows = None
+        if local:
+            after = bytes.fromhex(cursor.txid) if cursor.txid else None
+            # None if cursor txid isn't cached, continue from explorer then
+            rows = await crud.get_address_history(address.string, address.network, size, after=after)
+            local = rows is not None
+
+        if rows is not None:
+            page = [schema.TransactionDetail.from_rows(*r) for r in rows]
+            end = not page
+            txid = page[-1].id if page else cursor.txid
+        else:
+            page = list(map(schema.TransactionDetail.from_instance, await fetch_address_transactions(
+                address,
+                size,
+                cursor.offset,
+                cursor.txid
+            )))
+            # testnet pages (blockstream.info) are continued after the last chain transaction,
+            # the first one also contains mempool transactions
+            chain = [tx.id for tx in page if tx.blockheight != -1]
+            end = not page if address.network is NetworkType.MAIN else not chain
+            txid = chain[-1] if chain else cursor.txid
+
+        for tx in page:
+            yield tx.model_dump_json() + '\n'
+        if end:
+            yield '{"cursor": null}\n'
+            return
+        cursor = schema.HistoryCursor(offset=cursor.offset + len(page), txid=txid, local=local)
+        length -= len(page)
+
+    yield f'{{"cursor": "{cursor.encode()}"}}\n'
+
+
+async def sync_address_history(address: BaseAddress) -> bool:
+    """
+    Check whether address history is complete (see `is_history_complete`), if only the newest
+    transactions are missing (up to a page) fetch them. Cached unconfirmed transactions count
+    as missing, so they are refreshed or history stays incomplete if they were dropped
+    :return: True if address history can be served from db
+    """
+    try:
+        txcount = (await fetch_address_info(address)).tx_count
+    except HTTPException:
+        return False
+    confirmed, unconfirmed = await crud.count_address_transactions(address.string, address.network)
+    if not unconfirmed and confirmed == txcount:
+        return True
+    if not 0 < txcount - confirmed <= settings.EXPLORER_HISTORY_PAGE_SIZE:
+        return False
+
+    await fetch_address_transactions(address, txcount - confirmed, 0, None)
+    return await is_history_complete(address)
+
+
+async def is_history_local(address: BaseAddress) -> bool:
+    """
+    Source of address history (db or explorer), decided once per address version (see `_addresskey`),
+    so pages of the same history aren't mixed from sources with different order
+    """
+    key = await _addresskey(address) + ':local'
+    if (local := await addresscache.get(key)) is None:
+        local = await sync_address_history(address)
+        await addresscache.set(key, local)
+    return local
 
 
 async def get_unspent(
     address: BaseAddress,
     include_transaction: bool
 ) -> list[schema.Unspent] | list[schema.TransactionUnspent]:
-    unspent: list[models.Unspent] = list(await crud.get_unspent(address.string))
+    # no explorer request, cached outputs are derived only if address info is cached
+    derived = await is_history_complete(address, fetch=False)
+    unspent = await crud.get_unspent(address.string, address.network, derived=derived)
     if not include_transaction:
         return [schema.Unspent.from_model(u) for u in unspent]
 
@@ -211,12 +688,12 @@ async def get_unspent(
         txunspent.setdefault(u.txid, [])
         txunspent[u.txid].append(u)
 
-    for tx in await crud.find_transactions(transactions, load_unspent=False):
-        transactions[tx.id] = tx
+    for txid, rows in (await crud.find_transactions_rows(transactions, address.network)).items():
+        transactions[txid] = schema.TransactionDetail.from_rows(*rows)
 
     return [
         schema.TransactionUnspent(
-            transaction=schema.TransactionDetail.from_model(tx),
+            transaction=tx,
             unspent=[schema.Unspent.from_model(u) for u in txunspent[txid]]
         )
         for txid, tx in transactions.items() if tx
@@ -238,50 +715,119 @@ async def fetch_unspent(
 async def fetch_unspent(
     address: BaseAddress,
     include_transaction: bool = True
+) -> list[schema.TransactionUnspent] | list[schema.Unspent]:
+    try:
+        return await _fetch_unspent(address, include_transaction)
+    except exc.CircuitOpenError:
+        stale.set(True)
+        return await get_unspent(address, include_transaction)
+
+
+@_singleflight
+async def _fetch_unspent(
+    address: BaseAddress,
+    include_transaction: bool
 ) -> list[schema.TransactionUnspent] | list[schema.Unspent]:
     service = Service(address.network)
 
     # update unspent
     unspent: list[Unspent] = await service.get_unspent(address)
-    await crud.put_unspent(address.string, unspent)
+    if await crud.put_unspent(address.string, address.network, unspent):
+        await invalidate_address(address.network, address.string)
 
     if not include_transaction:
         return [schema.Unspent.from_instance(u) for u in unspent]
+    return _group_unspent(unspent, await _unspent_transactions(service, unspent))
 
-    # get unspent from service
-    transactions: dict[bytes, models.Transaction | None] = {}
-    txunspent: dict[bytes, list[Unspent]] = {}  # txid: list[unspent]
+
+async def fetch_unspent_batch(
+    addresses: list[BaseAddress],
+    network: NetworkType,
+    include_transaction: bool
+) -> list[schema.AddressUnspent]:
+    """
+    Fetch unspent of many addresses (with bounded concurrency), write them in one
+    db transaction and resolve transactions of all of them at once
+    """
+    service = Service(network)
+    semaphore = asyncio.Semaphore(settings.EXPLORER_BATCH_CONCURRENCY)
+
+    async def fetch(address: BaseAddress) -> list[Unspent]:
+        async with semaphore:
+            return await service.get_unspent(address)
+
+    try:
+        fetched: list[list[Unspent]] = await asyncio.gather(*map(fetch, addresses))
+    except exc.CircuitOpenError:
+        stale.set(True)
+        return [
+            schema.AddressUnspent(address=a.string, unspent=await get_unspent(a, include_transaction))
+            for a in addresses
+        ]
+
+    diffs = await crud.put_unspents(network, {a.string: u for a, u in zip(addresses, fetched)})
+    await invalidate_address(network, *(a for a, diff in diffs.items() if diff))
+
+    if not include_transaction:
+        return [
+            schema.AddressUnspent(address=a.string, unspent=[schema.Unspent.from_instance(u) for u in unspent])
+            for a, unspent in zip(addresses, fetched)
+        ]
+
+    transactions = await _unspent_transactions(service, [u for unspent in fetched for u in unspent])
+    return [
+        schema.AddressUnspent(address=a.string, unspent=_group_unspent(unspent, transactions))
+        for a, unspent in zip(addresses, fetched)
+    ]
+
+
+async def _unspent_transactions(
+    service: Service,
+    unspent: list[Unspent]
+) -> dict[bytes, schema.TransactionDetail]:
+    """
+    Get transactions of unspent, cached ones (with updated blockheight if need) from db
+    and uncached from service (they are added to db)
+    """
+    transactions: dict[bytes, schema.TransactionDetail | None] = {}
+    blocks: dict[bytes, int] = {}  # txid: unspent block
     for u in unspent:
         transactions.setdefault(u.txid, None)
-        txunspent.setdefault(u.txid, [])
-        txunspent[u.txid].append(u)
+        if u.block != -1:
+            blocks[u.txid] = u.block
 
     # get transactions and update their blockheight's (if need)
     to_update: dict[bytes, int] = {}
-    for tx in await crud.find_transactions(transactions, load_unspent=False):
-        if tx.blockheight == -1:
-            for u in txunspent[tx.id]:
-                if u.block != -1:
-                    to_update[tx.id] = tx.blockheight = u.block
-                    break
-        transactions[tx.id] = tx
+    for txid, rows in (await crud.find_transactions_rows(transactions, service.network)).items():
+        tx = schema.TransactionDetail.from_rows(*rows)
+        if tx.blockheight == -1 and txid in blocks:
+            to_update[txid] = tx.blockheight = blocks[txid]
+        transactions[txid] = tx
     if to_update:
-        await crud.update_transactions_blockheight(to_update)
+        await crud.update_transactions_blockheight(service.network, to_update)
 
     # get from service and add uncached transactions
     if to_add := [txid.hex() for txid, tx in transactions.items() if not tx]:
         fetched = await service.get_transactions(to_add)
-        transactions.update((tx.id, tx) for tx in await crud.add_transactions(
-            fetched,
-            service.previous_apiservice
-        ))
+        await crud.add_transactions(fetched, service.previous_apiservice)
+        transactions.update((tx.id, schema.TransactionDetail.from_instance(tx)) for tx in fetched)
 
+    return {txid: tx for txid, tx in transactions.items() if tx}
+
+
+def _group_unspent(
+    unspent: list[Unspent],
+    transactions: dict[bytes, schema.TransactionDetail]
+) -> list[schema.TransactionUnspent]:
+    txunspent: dict[bytes, list[Unspent]] = {}  # txid: list[unspent]
+    for u in unspent:
+        txunspent.setdefault(u.txid, []).append(u)
     return [
         schema.TransactionUnspent(
-            transaction=schema.TransactionDetail.from_model(tx),
+            transaction=transactions[txid],
             unspent=[schema.Unspent.from_instance(u) for u in txunspent[txid]]
         )
-        for txid, tx in transactions.items() if tx
+        for txid in txunspent if txid in transactions
     ]
 
 
@@ -295,4 +841,13 @@ async def broadcastx(serialized: str, network: NetworkType) -> schema.Transactio
         await service.push(tx)
     except ExplorerError as e:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, e.response.text)
-    return await get_or_add_transaction(tx.id, network, cached=False, detail=True)
+    detail = await get_or_add_transaction(tx.id, network, cached=False, detail=True)
+
+    # drop cache of addresses affected by the transaction
+    addresses = {o.address for o in detail.outputs if o.address}
+    addresses |= await crud.find_outputs_addresses(
+        ((bytes.fromhex(i.txid), i.vout) for i in detail.inputs),
+        network
+    )
+    await invalidate_address(network, *addresses)
+    return detail
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from typing import Callable, Awaitable, Iterable
+
+from fastapi import HTTPException
+from btclib import NetworkType
+
+
+logger = logging.getLogger(__name__)
+
+type Subscriber = Callable[[NetworkType, int], Awaitable[None]]
+
+
+class ChainTipTracker:
+    """
+    Polls head block height of every network in background. Last known height
+    is kept if refresh fails. Subscribers are notified about new blocks
+    """
+    def __init__(
+        self,
+        fetch: Callable[[NetworkType], Awaitable[int]],
+        interval: float,
+        networks: Iterable[NetworkType] = NetworkType
+    ):
+        self.fetch = fetch
+        self.interval = interval
+        self.networks = list(networks)
+        self.heights: dict[NetworkType, int] = {}
+        self.subscribers: list[Subscriber] = []
+        self.locks = {n: asyncio.Lock() for n in self.networks}
+        self.tasks: set[asyncio.Task] = set()
+
+    def subscribe(self, callback: Subscriber) -> Subscriber:
+        self.subscribers.append(callback)
+        return callback
+
+    async def refresh(self, network: NetworkType, missing: bool = False) -> int:
+        """
+        :param missing: Fetch only if height is still unknown after lock is acquired
+                        (concurrent first callers wait for the one that fetches)
+        """
+        async with self.locks[network]:
+            if missing and (height := self.heights.get(network)) is not None:
+                return height
+            height = await self.fetch(network)
+            previous = self.heights.get(network)
+            self.heights[network] = height
+
+        if previous is not None and height > previous:
+            logger.info('new %s block %d', network.value, height)
+            for callback in self.subscribers:
+                self.spawn(self.notify(callback, network, height))
+        return height
+
+    async def notify(self, callback: Subscriber, network: NetworkType, height: int) -> None:
+        try:
+            await callback(network, height)
+        except Exception:
+            logger.exception('new block subscriber %r failed', callback)
+
+    async def height(self, network: NetworkType) -> int:
+        """
+        Last known height, fetch it only if there wasn't any successful refresh yet
+        """
+        if (height := self.heights.get(network)) is not None:
+            return height
+        return await self.refresh(network, missing=True)
+
+    async def poll(self, network: NetworkType) -> None:
+        while True:
+            try:
+                await self.refresh(network)
+            except HTTPException as e:
+                logger.warning('failed to refresh %s head block: %s', network.value, e.detail)
+            except Exception:
+                logger.exception('failed to refresh %s head block', network.value)
+            await asyncio.sleep(self.interval)
+
+    def spawn(self, coro: Awaitable) -> None:
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def start(self) -> None:
+        for network in self.networks:
+            self.spawn(self.poll(network))
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
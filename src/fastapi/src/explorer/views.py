@@ -1,6 +1,8 @@
-from typing import Annotated
-from fastapi import APIRouter, Query, Path, Depends
+from typing import Annotated, AsyncIterator, Literal, Any
+from fastapi import APIRouter, HTTPException, Query, Path, Depends, Response, status
+from fastapi.responses import StreamingResponse
 from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter
 from btclib import NetworkType, BaseAddress
 
 from . import schema, service
@@ -15,6 +17,24 @@ router = APIRouter(
 )
 
 
+def markstale(response: Response) -> None:
+    if service.stale.get():
+        response.headers['Warning'] = '110 - "Response is Stale"'
+
+
+anyjson = TypeAdapter(Any)
+
+
+def trusted(content: Any) -> Response:
+    """
+    Serialize content built from our db or btclib (see schema constructors) directly,
+    without response_model validation. response_model is left for docs only
+    """
+    response = Response(anyjson.dump_json(content), media_type='application/json')
+    markstale(response)
+    return response
+
+
 def currentaddr(
     addresstr: Annotated[str, Path]
 ) -> BaseAddress:
@@ -26,14 +46,17 @@ def currentaddr(
 
 
 @router.get('/head', response_model=schema.HeadBlock)
-async def get_head_block(network: NetworkType = NetworkType.MAIN):
-    return await service.gethead(network)
+async def get_head_block(response: Response, network: NetworkType = NetworkType.MAIN):
+    r = await service.gethead(network)
+    markstale(response)
+    return r
 
 
 @router.get('/address/{addresstr}', response_model=schema.AddressInfo)
-async def get_address(address: Annotated[BaseAddress, Depends(currentaddr)]):
-    # todo: add cache?
-    return await service.getaddrinfo(address)
+async def get_address(address: Annotated[BaseAddress, Depends(currentaddr)], response: Response):
+    r = await service.getaddrinfo(address)
+    markstale(response)
+    return r
 
 
 @router.get(
@@ -50,7 +73,7 @@ async def get_address_transactions(
     length: int | None = None,
     offset: int | None = None,
     last_seen_txid: str | None = None
-):  # todo: add cache?
+):
     try:
         input = schema.GetAddressTransactionsInput(
             network=address.network,
@@ -61,12 +84,38 @@ async def get_address_transactions(
     except schema.ValidationError as e:
         raise RequestValidationError(e.errors())
     # todo: testnet network returns 75+- transactions, not length
-    return await service.get_address_transactions(
+    return trusted(await service.get_address_transactions(
         address,
         input.length,
         input.offset,
         input.last_seen_txid
-    )
+    ))
+
+
+@router.get(
+    '/address/{addresstr}/transactions/stream',
+    description='Stream address transactions as NDJSON, one transaction per line. '
+                'Last line contains cursor of the next page (null if there are no more transactions)',
+    response_class=StreamingResponse
+)
+async def stream_address_transactions(
+    address: Annotated[BaseAddress, Depends(currentaddr)],
+    cursor: str | None = None,
+    length: Annotated[int | None, Query(gt=0)] = None
+):
+    try:
+        position = schema.HistoryCursor.decode(cursor) if cursor else schema.HistoryCursor()
+    except ValueError as e:
+        raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, str(e))
+
+    lines = service.stream_address_transactions(address, position, length)
+    first = await anext(lines)  # explorer/db errors are raised before response is started
+
+    async def body() -> AsyncIterator[str]:
+        yield first
+        async for line in lines:
+            yield line
+    return StreamingResponse(body(), media_type='application/x-ndjson')
 
 
 @router.get(
@@ -79,12 +128,17 @@ async def get_address_unspent(
     cached: bool = False
 ):
     if cached:
-        return await service.get_unspent(address, include_transaction)
+        return trusted(await service.get_unspent(address, include_transaction))
     else:
-        return await service.fetch_unspent(
+        return trusted(await service.fetch_unspent(
             address,
             include_transaction  # type: ignore
-        )
+        ))
+
+
+@router.post('/unspent', response_model=list[schema.AddressUnspent])
+async def get_addresses_unspent(input: schema.GetUnspentBatchInput):
+    return trusted(await service.fetch_unspent_batch(input.instances, input.network, input.include_transaction))
 
 
 @router.get(
@@ -112,14 +166,34 @@ async def get_transaction(
         )
     ] = False
 ):
-    return await service.get_or_add_transaction(
+    return trusted(await service.get_or_add_transaction(
         bytes.fromhex(txid),
         network,
         cached,
         detail  # type: ignore
-    )
+    ))
+
+
+@router.get(
+    '/transaction/{txid}/raw',
+    description='Get serialized transaction',
+    response_class=Response,
+    responses={200: {'content': {'text/plain': {}, 'application/octet-stream': {}}}}
+)
+async def get_raw_transaction(
+    txid: Annotated[
+        str,
+        Path(pattern=r'\A[a-fA-F0-9]{64}\z')
+    ],
+    network: NetworkType = NetworkType.MAIN,
+    format: Literal['hex', 'binary'] = 'hex'
+):
+    serialized = await service.get_raw_transaction(bytes.fromhex(txid), network)
+    if format == 'binary':
+        return Response(serialized, media_type='application/octet-stream')
+    return Response(serialized.hex(), media_type='text/plain')
 
 
 @router.post('/transaction', response_model=schema.TransactionDetail)
 async def broadcast_transaction(input: schema.BroadcastTransactionInput, network: NetworkType):
-    return await service.broadcastx(input.serialized, network)
+    return trusted(await service.broadcastx(input.serialized, network))
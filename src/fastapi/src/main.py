@@ -1,3 +1,6 @@
+import asyncio
+import logging
+import contextlib
 import fastapi
 from .config import settings
 from .database import engine, BaseModel
@@ -5,10 +8,40 @@ from .database import engine, BaseModel
 from .auth.views import router as auth_router
 from .wallet.views import router as wallet_router
 from .explorer.views import router as explorer_router
+from .explorer.client import ExplorerAPI
+from .explorer.service import chaintip
+from .auth.crud import delete_expired_sessions
+from .wallet.cryptoutils import kdfpool
+from .wallet.signing import signpool
+
+
+logger = logging.getLogger(__name__)
+
+
+async def cleanup_sessions():
+    while True:
+        try:
+            await delete_expired_sessions()
+        except Exception:
+            logger.exception('failed to delete expired sessions')
+        await asyncio.sleep(settings.USER_SESSION_CLEANUP_INTERVAL)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: fastapi.FastAPI):
+    chaintip.start()
+    cleanup = asyncio.create_task(cleanup_sessions())
+    yield
+    cleanup.cancel()
+    await chaintip.stop()
+    await ExplorerAPI.aclose()
+    kdfpool.shutdown()
+    signpool.shutdown()
 
 
 app = fastapi.FastAPI(
     root_path='/api',
+    lifespan=lifespan,
     debug=settings.DEBUG,
     openapi_url=settings.OPEN_API_URL if settings.DEBUG else None,
 )
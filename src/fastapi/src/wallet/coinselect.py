@@ -0,0 +1,192 @@
+import math
+import random
+from typing import NamedTuple
+
+from btclib import AddressType
+
+
+# virtual sizes of inputs signed with Input.default_sign (P2TR isn't supported by it)
+INPUT_VSIZE = {
+    AddressType.P2PKH: 148,
+    AddressType.P2SH_P2WPKH: 91,
+    AddressType.P2WPKH: 68,
+    AddressType.P2WSH: 70  # 1-of-1 multisig witness script
+}
+# 65 bytes uncompressed public key instead of 33 bytes, witness bytes are discounted
+UNCOMPRESSED_VSIZE = {
+    AddressType.P2PKH: 32,
+    AddressType.P2SH_P2WPKH: 8,
+    AddressType.P2WPKH: 8,
+    AddressType.P2WSH: 8
+}
+TX_OVERHEAD_VSIZE = 11  # version, locktime, inputs/outputs count, segwit marker
+DUST = 546
+BNB_TRIES = 100_000
+KNAPSACK_ITERATIONS = 1000
+
+
+class Coin(NamedTuple):
+    txid: bytes
+    vout: int
+    amount: int
+    address: str
+    type: AddressType
+    compressed: bool = True  # public key
+
+    @property
+    def vsize(self) -> int:
+        return input_vsize(self.type, self.compressed)
+
+    def effective(self, feerate: float) -> int:
+        """
+        Amount minus fee for spending it
+        """
+        return self.amount - math.ceil(self.vsize * feerate)
+
+
+class Selection(NamedTuple):
+    coins: list[Coin]
+    fee: int
+    change: int  # 0 if there is no change output
+    vsize: int
+
+
+class InsufficientFunds(Exception):
+    ...
+
+
+def input_vsize(type: AddressType, compressed: bool = True) -> int:
+    return INPUT_VSIZE[type] + (0 if compressed else UNCOMPRESSED_VSIZE[type])
+
+
+def output_vsize(pkscript: bytes) -> int:
+    return 8 + 1 + len(pkscript)  # amount, script length, script
+
+
+def branch_and_bound(values: list[int], target: int, window: int) -> list[int] | None:
+    """
+    Depth-first search of a subset with sum in [target, target + window] (no change output
+    is needed) and the least excess
+    :param values: Effective values sorted descending
+    :return: Indexes of values
+    """
+    best: list[int] | None = None
+    bestexcess = window + 1
+    available, value = sum(values), 0
+    selection: list[int] = []
+    index = 0
+
+    for _ in range(BNB_TRIES):
+        if value + available < target or value > target + window:
+            backtrack = True
+        elif value >= target:
+            if value - target < bestexcess:
+                best, bestexcess = list(selection), value - target
+                if not bestexcess:
+                    break
+            backtrack = True
+        else:
+            backtrack = False
+
+        if backtrack:
+            if not selection:
+                break  # all combinations are searched
+            # return omitted values after the last selected one, exclude last selected
+            index -= 1
+            while index > selection[-1]:
+                available += values[index]
+                index -= 1
+            value -= values[index]
+            selection.pop()
+        else:
+            available -= values[index]
+            # excluding a value and including an equal next one gives the same sum
+            if not selection or selection[-1] == index - 1 or values[index] != values[index - 1]:
+                selection.append(index)
+                value += values[index]
+        index += 1
+
+    return best
+
+
+def knapsack(values: list[int], target: int) -> list[int] | None:
+    """
+    The smallest value not less than target or stochastic approximation of the best
+    subset of smaller values, whichever sum is closer to target
+    :return: Indexes of values
+    """
+    larger = [i for i, v in enumerate(values) if v >= target]
+    lowest = min(larger, key=values.__getitem__) if larger else None
+    smaller = sorted((i for i, v in enumerate(values) if v < target), key=lambda i: -values[i])
+    total = sum(values[i] for i in smaller)
+
+    if total == target:
+        return smaller
+    if total < target:
+        return [lowest] if lowest is not None else None
+
+    best, besttotal = [True] * len(smaller), total
+    for _ in range(KNAPSACK_ITERATIONS):
+        if besttotal == target:
+            break
+        included, s, reached = [False] * len(smaller), 0, False
+        for npass in range(2):
+            if reached:
+                break
+            for n, i in enumerate(smaller):
+                if included[n] if npass else random.random() >= 0.5:
+                    continue
+                s += values[i]
+                included[n] = True
+                if s >= target:
+                    reached = True
+                    if s < besttotal:
+                        best, besttotal = list(included), s
+                    s -= values[i]
+                    included[n] = False
+
+    if lowest is not None and values[lowest] <= besttotal:
+        return [lowest]
+    return [i for n, i in enumerate(smaller) if best[n]]
+
+
+def select(
+    coins: list[Coin],
+    amount: int,
+    outputs_vsize: int,
+    change_pkscript: bytes,
+    change_type: AddressType,
+    change_compressed: bool,
+    feerate: float
+) -> Selection:
+    """
+    Select coins to pay amount of outputs with fee. Branch and bound is tried first to find
+    a changeless selection, knapsack is used otherwise
+    :param outputs_vsize: Virtual size of all outputs (without change)
+    :param feerate: sat/vB
+    """
+    coins = sorted(
+        (c for c in coins if c.type in INPUT_VSIZE and c.effective(feerate) > 0),
+        key=lambda c: -c.effective(feerate)
+    )
+    values = [c.effective(feerate) for c in coins]
+    target = amount + math.ceil((TX_OVERHEAD_VSIZE + outputs_vsize) * feerate)
+    changefee = math.ceil(output_vsize(change_pkscript) * feerate)
+    # change output and spending it later
+    costofchange = changefee + (
+        math.ceil(input_vsize(change_type, change_compressed) * feerate) if change_type in INPUT_VSIZE else 0
+    )
+
+    if (indexes := branch_and_bound(values, target, costofchange)) is None:
+        indexes = knapsack(values, target + changefee + DUST) or knapsack(values, target)
+    if indexes is None:
+        raise InsufficientFunds
+
+    selected = [coins[i] for i in indexes]
+    vsize = TX_OVERHEAD_VSIZE + outputs_vsize + sum(c.vsize for c in selected)
+    change = sum(values[i] for i in indexes) - target - changefee
+    if change < DUST:
+        change = 0
+    else:
+        vsize += output_vsize(change_pkscript)
+    return Selection(selected, sum(c.amount for c in selected) - amount - change, change, vsize)
@@ -1,13 +1,14 @@
 from typing import Sequence, cast, Iterable
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update, delete, insert
 from sqlalchemy.orm import selectinload
-from btclib import PrivateKey, NetworkType, AddressType
+from btclib import PrivateKey, PublicKey, NetworkType, AddressType
 
 from ..database import SessionLocal
-from ..crud import catch_unique
+from ..crud import catch_unique, chunked
 from ..models import User
-from . import cryptoutils as cu
-from .models import UserBitcoinKey, UserBitcoinAddress
+from . import hd, cryptoutils as cu
+from .keygen import GeneratedKey
+from .models import UserBitcoinKey, UserBitcoinAddress, UserBitcoinSeed, UserBitcoinChain
 
 
 async def get_address(userid: int, string: str) -> UserBitcoinAddress | None:
@@ -42,7 +43,10 @@ async def get_address_by_shortname(userid: int, shortname: str) -> UserBitcoinAd
         )
 
 
-async def add_or_get_pkey(user: User, userpassword: str, p: PrivateKey) -> UserBitcoinKey:
+async def add_or_get_pkey(user: User, ck: bytes, p: PrivateKey) -> UserBitcoinKey:
+    """
+    :param ck: Decrypted user common key
+    """
     rawp = p.to_bytes()
     pdigest = cu.dsha256(rawp)
 
@@ -59,7 +63,6 @@ async def add_or_get_pkey(user: User, userpassword: str, p: PrivateKey) -> UserB
 
     rawpub = p.public.key.to_string()
     pubx, puby = rawpub[:32], rawpub[32:]
-    ck = cu.kdfdecrypt(userpassword, user.ckey_encrypted, user.kdf_options, user.kdf_digest)
 
     async with SessionLocal() as session, session.begin():
         session.add(pk := UserBitcoinKey(
@@ -88,7 +91,7 @@ async def get_addresses(
 
 
 async def create_address(user: User,
-                         userpassword: str,
+                         ck: bytes,
                          type: AddressType,
                          network: NetworkType,
                          shortname: str,
@@ -97,7 +100,7 @@ async def create_address(user: User,
                          p: PrivateKey | None = None) -> UserBitcoinAddress:
 
     p = p or PrivateKey(pubkey_network=network, pubkey_compressed=pubkey_compressed)
-    p_bd = await add_or_get_pkey(user, userpassword, p)
+    p_bd = await add_or_get_pkey(user, ck, p)
     address = p.public.get_address(type)
 
     async with SessionLocal() as session:
@@ -115,6 +118,133 @@ async def create_address(user: User,
         return address_bd
 
 
+async def get_existing_shortnames(userid: int, shortnames: Iterable[str]) -> Sequence[str]:
+    async with SessionLocal() as session:
+        return (await session.scalars(
+            select(UserBitcoinAddress.shortname)
+            .where(
+                UserBitcoinAddress.userid == userid,
+                UserBitcoinAddress.shortname.in_(shortnames)
+            )
+        )).all()
+
+
+async def create_addresses(user: User,
+                           keys: list[GeneratedKey],
+                           type: AddressType,
+                           network: NetworkType,
+                           shortnames: list[str],
+                           emojid: str,
+                           pubkey_compressed: bool) -> list[UserBitcoinAddress]:
+    """
+    Save generated keys and their addresses in one transaction using multi-row inserts
+    """
+    async with SessionLocal() as session, session.begin():
+        keyids: dict[bytes, int] = {}
+        for rows in chunked([
+            {
+                'userid': user.id,
+                'encrypted': encrypted,
+                'dsha256_digest': digest,
+                'pubkey_xb': pubx,
+                'pubkey_yb': puby
+            }
+            for encrypted, digest, pubx, puby, _ in keys
+        ]):
+            keyids.update((await session.execute(
+                insert(UserBitcoinKey)
+                .values(rows)
+                .returning(UserBitcoinKey.dsha256_digest, UserBitcoinKey.id)
+            )).tuples().all())
+
+        addresses = []
+        for rows in chunked([
+            {
+                'userid': user.id,
+                'string': string,
+                'type': type,
+                'network': network,
+                'is_pubkey_compressed': pubkey_compressed,
+                'keyid': keyids[digest],
+                'shortname': shortname,
+                'emojid': emojid
+            }
+            for (_, digest, _, _, string), shortname in zip(keys, shortnames)
+        ]):
+            addresses.extend((await session.scalars(
+                insert(UserBitcoinAddress)
+                .values(rows)
+                .returning(UserBitcoinAddress)
+            )).all())
+        return addresses
+
+
+async def get_seed(userid: int) -> UserBitcoinSeed | None:
+    async with SessionLocal() as session:
+        return await session.get(UserBitcoinSeed, userid)
+
+
+async def create_seed(userid: int, ck: bytes, seed: bytes) -> bool:
+    """
+    Save hd seed encrypted with common key and public nodes of its chains
+    :return: False if user already has seed
+    """
+    async with SessionLocal() as session:
+        session.add(UserBitcoinSeed(
+            userid=userid,
+            encrypted=cu.encrypt(ck, seed),
+            dsha256_digest=cu.dsha256(seed)
+        ))
+        for type in hd.PURPOSE:
+            for network in NetworkType:
+                pubkey, chaincode = hd.neuter(hd.derive(seed, hd.chainpath(type, network)))
+                session.add(UserBitcoinChain(
+                    userid=userid,
+                    type=type,
+                    network=network,
+                    pubkey=pubkey,
+                    chaincode=chaincode
+                ))
+        return not await catch_unique(session.commit())
+
+
+async def derive_address(userid: int,
+                         type: AddressType,
+                         network: NetworkType,
+                         shortname: str,
+                         emojid: str) -> UserBitcoinAddress | None:
+    """
+    Derive next address of hd chain, private key isn't needed
+    :return: None if user doesn't have seed
+    """
+    async with SessionLocal() as session, session.begin():
+        chain = await session.scalar(
+            select(UserBitcoinChain)
+            .where(
+                UserBitcoinChain.userid == userid,
+                UserBitcoinChain.type == type,
+                UserBitcoinChain.network == network
+            )
+            .with_for_update()
+        )
+        if not chain:
+            return None
+
+        index, chain.nextindex = chain.nextindex, chain.nextindex + 1
+        pubkey, _ = hd.pubchild((chain.pubkey, chain.chaincode), index)
+        session.add(address := UserBitcoinAddress(
+            userid=userid,
+            string=PublicKey.from_bytes(pubkey, network).get_address(type).string,
+            type=type,
+            network=network,
+            is_pubkey_compressed=True,
+            hdindex=index,
+            shortname=shortname,
+            emojid=emojid
+        ))
+        return address
+
+
 async def update_address(userid: int, address: str, shortname: str, emojid: str):
     async with SessionLocal() as session, session.begin():
         await session.execute(
@@ -133,6 +263,9 @@ async def update_address(userid: int, address: str, shortname: str, emojid: str)
 async def delete_address(address: UserBitcoinAddress):
     async with SessionLocal() as session:
         await session.delete(address)
+        if address.keyid is None:
+            await session.commit()
+            return
 
         anyaddress = await session.scalar(
             select(UserBitcoinAddress)
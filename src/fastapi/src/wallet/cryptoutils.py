@@ -9,8 +9,12 @@ from passlib.utils.binary import b64s_decode
 from Cryptodome.Cipher import AES
 from Cryptodome.Hash import SHA256
 
+from ..config import settings
+from ..executor import BoundedProcessPool
+
 
 context = CryptContext(['argon2'], argon2__rounds=32)
+kdfpool = BoundedProcessPool(settings.KDF_POOL_WORKERS, settings.KDF_POOL_MAX_PENDING)
 
 
 def dsha256(b: bytes) -> bytes:
@@ -72,3 +76,29 @@ def kdfdecrypt(password: str, encrypted: bytes, options: str, kdfhs: bytes) -> b
     if not consteq(dsha256(k), kdfhs):
         raise ValueError('wrong password')
     return decrypt(k, encrypted)
+
+
+def pwdhash(password: str) -> str:
+    return context.hash(password)
+
+
+def pwdverify(password: str, hashed: str) -> bool:
+    return context.verify(password, hashed)
+
+
+# argon2 calls are cpu-bound, so handlers run them in kdfpool processes
+
+async def apwdhash(password: str) -> str:
+    return await kdfpool.run(pwdhash, password)
+
+
+async def apwdverify(password: str, hashed: str) -> bool:
+    return await kdfpool.run(pwdverify, password, hashed)
+
+
+async def akdfencrypt(password: str, data: bytes) -> tuple[str, bytes, bytes]:
+    return await kdfpool.run(kdfencrypt, password, data)
+
+
+async def akdfdecrypt(password: str, encrypted: bytes, options: str, kdfhs: bytes) -> bytes:
+    return await kdfpool.run(kdfdecrypt, password, encrypted, options, kdfhs)
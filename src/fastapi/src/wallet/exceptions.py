@@ -0,0 +1,5 @@
+from fastapi import HTTPException, status
+
+
+WalletLockedError = HTTPException(status.HTTP_423_LOCKED, 'wallet is locked, unlock it or pass userpassword')
+InsufficientFundsError = HTTPException(status.HTTP_400_BAD_REQUEST, 'insufficient funds')
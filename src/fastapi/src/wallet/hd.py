@@ -0,0 +1,90 @@
+import hmac
+import hashlib
+
+from ecdsa import SigningKey, VerifyingKey, SECP256k1
+from btclib import AddressType, NetworkType
+
+from ..config import settings
+from ..cache import MemoryCache
+
+
+HARDENED = 0x80000000
+SEED_LENGTH = 32
+
+# BIP44/49/84 purposes, other types don't have a single key derivation standard
+PURPOSE = {
+    AddressType.P2PKH: 44,
+    AddressType.P2SH_P2WPKH: 49,
+    AddressType.P2WPKH: 84
+}
+COIN = {NetworkType.MAIN: 0, NetworkType.TEST: 1}
+
+type Node = tuple[bytes, bytes]  # key (32 bytes private or 33 bytes compressed public), chain code
+
+# seed digest:path -> private node, so signing derives only uncached children
+nodes = MemoryCache(settings.WALLET_HD_CACHE_SIZE, settings.WALLET_HD_CACHE_TTL)
+
+
+def chainpath(type: AddressType, network: NetworkType) -> list[int]:
+    """
+    Path of external (receive) chain of the first account: m/purpose'/coin'/0'/0
+    """
+    return [PURPOSE[type] | HARDENED, COIN[network] | HARDENED, HARDENED, 0]
+
+
+def pubkey(k: bytes) -> bytes:
+    """
+    :return: Compressed public key of private key
+    """
+    return SigningKey.from_string(k, SECP256k1).get_verifying_key().to_string('compressed')  # type: ignore
+
+
+def master(seed: bytes) -> Node:
+    i = hmac.digest(b'Bitcoin seed', seed, hashlib.sha512)
+    return i[:32], i[32:]
+
+
+def privchild(node: Node, index: int) -> Node:
+    k, c = node
+    data = (b'\x00' + k if index & HARDENED else pubkey(k)) + index.to_bytes(4)
+    i = hmac.digest(c, data, hashlib.sha512)
+    child = (int.from_bytes(i[:32]) + int.from_bytes(k)) % SECP256k1.order
+    return child.to_bytes(32), i[32:]
+
+
+def pubchild(node: Node, index: int) -> Node:
+    """
+    Public (not hardened) derivation, private key isn't needed
+    """
+    assert not index & HARDENED, 'hardened child of public node'
+    K, c = node
+    i = hmac.digest(c, K + index.to_bytes(4), hashlib.sha512)
+    point = SECP256k1.generator * int.from_bytes(i[:32]) + VerifyingKey.from_string(K, SECP256k1).pubkey.point
+    return VerifyingKey.from_public_point(point, SECP256k1).to_string('compressed'), i[32:]  # type: ignore
+
+
+def neuter(node: Node) -> Node:
+    return pubkey(node[0]), node[1]
+
+
+def derive(seed: bytes, path: list[int]) -> Node:
+    node = master(seed)
+    for index in path:
+        node = privchild(node, index)
+    return node
+
+
+def childkey(seed: bytes, digest: bytes, type: AddressType, network: NetworkType, index: int) -> bytes:
+    """
+    Private key of external chain address, chain node and child are cached
+    :param digest: Seed dsha256 digest (cache key)
+    """
+    path = chainpath(type, network)
+    key = f'{digest.hex()}:{"/".join(map(str, path))}'
+    if (child := nodes.getnowait(f'{key}/{index}')) is None:
+        if (chain := nodes.getnowait(key)) is None:
+            chain = derive(seed, path)
+            nodes.setnowait(key, chain)
+        child = privchild(chain, index)
+        nodes.setnowait(f'{key}/{index}', child)
+    return child[0]
@@ -0,0 +1,53 @@
+import math
+import asyncio
+
+from btclib import PrivateKey, AddressType, NetworkType
+
+from ..config import settings
+from . import cryptoutils as cu
+from .signing import signpool
+
+
+type GeneratedKey = tuple[bytes, bytes, bytes, bytes, str]  # encrypted, dsha256 digest, pubkey x, pubkey y, address string
+
+
+def generate_keys(
+    ck: bytes,
+    count: int,
+    type: AddressType,
+    network: NetworkType,
+    pubkey_compressed: bool
+) -> list[GeneratedKey]:
+    """
+    Generate private keys encrypted with common key and their addresses, runs in signpool process
+    """
+    r = []
+    for _ in range(count):
+        p = PrivateKey(pubkey_network=network, pubkey_compressed=pubkey_compressed)
+        rawp, rawpub = p.to_bytes(), p.public.key.to_string()
+        r.append((
+            cu.encrypt(ck, rawp),
+            cu.dsha256(rawp),
+            rawpub[:32],
+            rawpub[32:],
+            p.public.get_address(type).string
+        ))
+    return r
+
+
+async def generate(
+    ck: bytes,
+    count: int,
+    type: AddressType,
+    network: NetworkType,
+    pubkey_compressed: bool
+) -> list[GeneratedKey]:
+    """
+    Generate keys in signpool, split into chunks generated in parallel
+    """
+    size = max(settings.WALLET_KEYGEN_CHUNK_SIZE, math.ceil(count / signpool.max_workers))
+    chunks = await asyncio.gather(*(
+        signpool.run(generate_keys, ck, min(size, count - i), type, network, pubkey_compressed)
+        for i in range(0, count, size)
+    ))
+    return [k for chunk in chunks for k in chunk]
@@ -0,0 +1,55 @@
+import time
+from collections import OrderedDict
+
+from ..config import settings
+
+
+class Keyring:
+    """
+    Decrypted user common keys of unlocked sessions (by session token), saves argon2 run
+    per wallet operation. Keys are stored in bytearray and zeroed when they are locked,
+    expired or evicted (least recently used, when maxsize is exceeded), so `get` returns
+    a copy that stays valid for the caller. It's process-local, session is unlocked only
+    in worker that handled unlock
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.keys: OrderedDict[str, tuple[float, bytearray]] = OrderedDict()  # token: (expire, key)
+
+    @staticmethod
+    def zero(key: bytearray) -> None:
+        key[:] = bytes(len(key))
+
+    def unlock(self, token: str, key: bytes, ttl: float) -> None:
+        self.purge()
+        self.lock(token)
+        self.keys[token] = (time.monotonic() + ttl, bytearray(key))
+        while len(self.keys) > self.maxsize:
+            self.zero(self.keys.popitem(last=False)[1][1])
+
+    def get(self, token: str) -> bytes | None:
+        if not (item := self.keys.get(token)):
+            return None
+
+        expire, key = item
+        if expire < time.monotonic():
+            self.lock(token)
+            return None
+
+        self.keys.move_to_end(token)
+        return bytes(key)
+
+    def lock(self, *tokens: str) -> None:
+        for token in tokens:
+            if item := self.keys.pop(token, None):
+                self.zero(item[1])
+
+    def purge(self) -> None:
+        """
+        Lock expired sessions
+        """
+        now = time.monotonic()
+        self.lock(*(token for token, (expire, _) in self.keys.items() if expire < now))
+
+
+keyring = Keyring(settings.WALLET_KEYRING_SIZE)
@@ -1,5 +1,5 @@
 import btclib
-from sqlalchemy import types, ForeignKey, UniqueConstraint, PrimaryKeyConstraint, Enum
+from sqlalchemy import types, ForeignKey, UniqueConstraint, PrimaryKeyConstraint, CheckConstraint, Enum
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from .. import models
 
@@ -29,12 +29,41 @@ class UserBitcoinAddress(models.BaseModel, models.CreatedMixin):
     type: Mapped[btclib.AddressType]
     network: Mapped[models.networkenum]
     is_pubkey_compressed: Mapped[bool]
-    keyid: Mapped[int] = mapped_column(ForeignKey(UserBitcoinKey.id))
+    keyid: Mapped[int | None] = mapped_column(ForeignKey(UserBitcoinKey.id))
+    hdindex: Mapped[int | None]  # index in hd external chain of type and network (see hd.chainpath)
     shortname: Mapped[str] = mapped_column(types.String(64))
     emojid: Mapped[str]
 
-    key: Mapped[UserBitcoinKey] = relationship(back_populates='addresses')
+    key: Mapped[UserBitcoinKey | None] = relationship(back_populates='addresses')
 
     __table_args__ = (
         PrimaryKeyConstraint(userid, string),
+        UniqueConstraint('userid', 'type', 'network', 'hdindex'),
+        CheckConstraint('(keyid IS NULL) != (hdindex IS NULL)', name='ck_user_bitcoin_address_key_or_hdindex'),
+    )
+
+
+class UserBitcoinSeed(models.BaseModel, models.CreatedMixin):
+    __tablename__ = 'user_bitcoin_seed'
+
+    userid: Mapped[models.userid] = mapped_column(primary_key=True)
+    encrypted: Mapped[bytes]
+    dsha256_digest: Mapped[bytes] = mapped_column(types.LargeBinary(32))
+
+
+class UserBitcoinChain(models.BaseModel):
+    """
+    Public node of hd external chain, addresses are derived from it without seed
+    """
+    __tablename__ = 'user_bitcoin_chain'
+
+    userid: Mapped[models.userid] = mapped_column()
+    type: Mapped[btclib.AddressType]
+    network: Mapped[models.networkenum]
+    pubkey: Mapped[bytes] = mapped_column(types.LargeBinary(33))
+    chaincode: Mapped[bytes] = mapped_column(types.LargeBinary(32))
+    nextindex: Mapped[int] = mapped_column(default=0)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('userid', 'type', 'network'),
     )
@@ -5,7 +5,9 @@ from pydantic import BaseModel, ConfigDict, Field, field_validator, ValidationIn
 import btclib
 
 from ..schema import hexstring, base64regexp
+from ..config import settings
 from .models import UserBitcoinAddress
+from . import hd
 
 
 class InputKeyType(StrEnum):
@@ -54,12 +56,47 @@ class UserAddress(BaseAddress, MutableUserAddressParams):
 
 class UserAddressOut(UserAddress):
     string: str
+    hdindex: int | None = None
 
     model_config = ConfigDict(from_attributes=True)
 
 
 class CreateAddressIn(UserAddress):
+    userpassword: str | None = Field(default=None, description='Not required if wallet is unlocked')
+
+
+class CreateAddressesIn(BaseAddress):
+    count: int = Field(gt=0, le=settings.WALLET_BATCH_MAX_ADDRESSES)
+    shortname: str = Field(
+        max_length=UserBitcoinAddress.shortname.type.length - len(str(settings.WALLET_BATCH_MAX_ADDRESSES)),
+        description='Prefix of shortnames, address number (from 1) is appended to it'
+    )
+    emojid: str
+    userpassword: str | None = Field(default=None, description='Not required if wallet is unlocked')
+
+    @property
+    def shortnames(self) -> list[str]:
+        return [f'{self.shortname}{n}' for n in range(1, self.count + 1)]
+
+
+class CreateHDWalletIn(BaseModel):
+    userpassword: str | None = Field(default=None, description='Not required if wallet is unlocked')
+
+
+class DeriveAddressIn(MutableUserAddressParams):
+    type: btclib.AddressType
+    network: btclib.NetworkType = btclib.NetworkType.MAIN
+
+    @field_validator('type')
+    def validatetype(cls, v: btclib.AddressType):
+        if v not in hd.PURPOSE:
+            raise ValueError(f'hd addresses can be {", ".join(t.value for t in hd.PURPOSE)}')
+        return v
+
+
+class UnlockIn(BaseModel):
     userpassword: str
+    ttl: int = Field(default=settings.WALLET_KEYRING_TTL, gt=0, le=settings.WALLET_KEYRING_MAX_TTL)
 
 
 class ImportAddressIn(CreateAddressIn, ObtainedAddressIn):
@@ -100,8 +137,39 @@ class CreateTransactionIn(BaseModel):
     outputs: list[CreateTransactionOutputAddress | CreateTransactionOutputPkscript]
     version: int = btclib.const.DEFAULT_VERSION
     locktime: int = btclib.const.DEFAULT_LOCKTIME
-    userpassword: str
+    userpassword: str | None = Field(default=None, description='Not required if wallet is unlocked')
 
 
 class CreateTransactionOut(BaseModel):
     serialized: hexstring.notempty
+
+
+class EstimateTransactionIn(BaseModel):
+    outputs: list[CreateTransactionOutputAddress | CreateTransactionOutputPkscript] = Field(min_length=1)
+    feerate: float = Field(gt=0, description='Fee rate in sat/vB')
+    network: btclib.NetworkType = btclib.NetworkType.MAIN
+    addresses: list[str] | None = Field(
+        default=None,
+        description='User addresses to spend, all user addresses of network by default'
+    )
+    change: str | None = Field(
+        default=None,
+        description='User address for change, address of the largest spent unspent by default'
+    )
+    version: int = btclib.const.DEFAULT_VERSION
+    locktime: int = btclib.const.DEFAULT_LOCKTIME
+
+
+class EstimateTransactionOut(BaseModel):
+    inputs: list[CreateTransactionInput]
+    change: CreateTransactionOutputAddress | None
+    fee: int
+    vsize: int
+
+
+class AutoTransactionIn(EstimateTransactionIn):
+    userpassword: str | None = Field(default=None, description='Not required if wallet is unlocked')
+
+
+class AutoTransactionOut(EstimateTransactionOut, CreateTransactionOut):
+    ...
@@ -0,0 +1,105 @@
+import math
+import asyncio
+from typing import Iterable
+
+from btclib import address, PrivateKey, Input, RawTransaction, Transaction
+
+from ..config import settings
+from ..cache import MemoryCache
+from ..executor import BoundedProcessPool
+from . import hd, cryptoutils as cu
+from .models import UserBitcoinAddress, UserBitcoinSeed
+
+
+signpool = BoundedProcessPool(settings.WALLET_SIGN_POOL_WORKERS, settings.WALLET_SIGN_POOL_MAX_PENDING)
+
+# (keyid or seed digest and hdindex, network, type): address string derived from the key, saves public key derivation
+derived = MemoryCache(settings.WALLET_DERIVED_ADDRESS_CACHE_SIZE)
+
+type SignKey = tuple[bytes, str]  # raw private key, address string
+
+
+def decrypt_keys(
+    ck: bytes,
+    addresses: Iterable[UserBitcoinAddress],
+    seed: UserBitcoinSeed | None = None
+) -> dict[str, bytes]:
+    """
+    Decrypt private keys of addresses (with loaded key), each distinct key once.
+    Keys of hd addresses are derived from seed, it's decrypted once
+    :return: {address string: raw private key}
+    :raise ValueError: Saved private key doesn't belong to address (its string is passed)
+    """
+    rawkeys: dict[int, bytes] = {}
+    rawseed = None
+    r = {}
+    for a in addresses:
+        if a.hdindex is not None:
+            if seed is None:
+                raise ValueError(a.string)
+            if rawseed is None:
+                rawseed = cu.decrypt(ck, seed.encrypted)
+                if cu.dsha256(rawseed) != seed.dsha256_digest:
+                    raise ValueError(a.string)
+            rawkey = hd.childkey(rawseed, seed.dsha256_digest, a.type, a.network, a.hdindex)
+            key = f'{seed.dsha256_digest.hex()}:{a.hdindex}:{a.network.value}:{a.type.value}'
+
+        else:
+            if (rawkey := rawkeys.get(a.keyid)) is None:
+                rawkey = rawkeys[a.keyid] = cu.decrypt(ck, a.key.encrypted)
+                if cu.dsha256(rawkey) != a.key.dsha256_digest:
+                    raise ValueError(a.string)
+            key = f'{a.keyid}:{a.network.value}:{a.type.value}'
+
+        if (string := derived.getnowait(key)) is None:
+            string = PrivateKey.from_bytes(rawkey).public.change_network(a.network).get_address(a.type).string
+            derived.setnowait(key, string)
+        if string != a.string:
+            raise ValueError(a.string)
+        r[a.string] = rawkey
+    return r
+
+
+def sign_inputs(serialized: bytes, amounts: list[int], keys: dict[int, SignKey]) -> bytes:
+    """
+    Sign inputs (by index) of unsigned transaction, runs in signpool process
+    :return: Serialized transaction with these inputs signed
+    """
+    tx = Transaction.deserialize(serialized, amounts)
+    for index, (rawkey, addresstr) in keys.items():
+        i = tx.inputs[index]
+        tx.inputs[index] = Input(
+            i.txid,
+            i.vout,
+            i.amount,
+            PrivateKey.from_bytes(rawkey),
+            address.from_string(addresstr),
+            i.sequence
+        )
+    for index in keys:
+        tx.inputs[index].default_sign(tx)
+    return tx.serialize()
+
+
+async def sign(tx: Transaction, keys: dict[int, SignKey]) -> bytes:
+    """
+    Sign transaction inputs in signpool. Signature hash of an input doesn't depend on
+    scripts of other inputs, so inputs are split into chunks signed in parallel
+    :param tx: Unsigned transaction
+    :param keys: {input index: key}
+    :return: Serialized signed transaction
+    """
+    serialized, amounts = tx.serialize(), [i.amount for i in tx.inputs]
+    indexes = list(keys)
+    size = max(settings.WALLET_SIGN_CHUNK_SIZE, math.ceil(len(indexes) / signpool.max_workers))
+    chunks = [indexes[i:i + size] for i in range(0, len(indexes), size)]
+
+    signed = await asyncio.gather(*(
+        signpool.run(sign_inputs, serialized, amounts, {i: keys[i] for i in chunk})
+        for chunk in chunks
+    ))
+    for chunk, s in zip(chunks, signed):
+        inputs = RawTransaction.deserialize(s).inputs
+        for i in chunk:
+            tx.inputs[i].custom_sign(inputs[i].script, inputs[i].witness)
+    return tx.serialize()
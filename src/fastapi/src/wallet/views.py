@@ -2,16 +2,60 @@ import base64
 from typing import Annotated
 from fastapi import Request, status, APIRouter, Depends, Path, HTTPException
 
-from btclib import address, PrivateKey, Input, Output, Transaction, Script
+from btclib import address, PrivateKey, UnsignableInput, Output, Transaction, Script
 from ..models import User
-from ..auth import currentuser
+from ..auth import currentuser, currentsession
+from ..auth.crud import utcnow
+from ..auth.models import UserSession
 from ..auth.exceptions import InvalidPasswordError
-from . import schema, crud, models, cryptoutils as cu
+from . import schema, crud, models, signing, keygen, coinselect, hd, cryptoutils as cu
+from .keyring import keyring
+from .exceptions import WalletLockedError, InsufficientFundsError
+from ..explorer import crud as explorercrud, service as explorerservice
+from ..explorer.exceptions import ServiceUnavailableError
+from ..config import settings
 
 
 router = APIRouter(prefix='/wallet')
 
 
+async def decryptck(user: User, password: str) -> bytes:
+    try:
+        return await cu.akdfdecrypt(password, user.ckey_encrypted, user.kdf_options, user.kdf_digest)
+    except ValueError:
+        raise InvalidPasswordError
+
+
+async def commonkey(session: UserSession, password: str | None) -> bytes:
+    """
+    Decrypted user common key, from keyring if password isn't passed
+    """
+    if password is not None:
+        return await decryptck(session.user, password)
+    if (ck := keyring.get(session.token)) is None:
+        raise WalletLockedError
+    return ck
+
+
+@router.post(
+    '/unlock',
+    status_code=status.HTTP_204_NO_CONTENT,
+    description='Keep decrypted key in memory for ttl seconds (not longer than session), '
+                'so wallet operations of this session don\'t need userpassword'
+)
+async def unlock(
+    session: Annotated[UserSession, Depends(currentsession)],
+    input: schema.UnlockIn
+):
+    ck = await decryptck(session.user, input.userpassword)
+    keyring.unlock(session.token, ck, min(input.ttl, (session.expire - utcnow()).total_seconds()))
+
+
+@router.post('/lock', status_code=status.HTTP_204_NO_CONTENT)
+async def lock(session: Annotated[UserSession, Depends(currentsession)]):
+    keyring.lock(session.token)
+
+
 @router.get(
     '/address',
     response_model=list[schema.UserAddressOut]
@@ -98,14 +142,15 @@ async def check_shortname_exists(
 
 
 async def newaddr(
-    user: User,
+    session: UserSession,
     a: schema.CreateAddressIn,
     p: PrivateKey | None = None
 ):
+    ck = await commonkey(session, a.userpassword)
     try:
         return await crud.create_address(
-            user,
-            a.userpassword,
+            session.user,
+            ck,
             a.type,
             a.network,
             a.shortname,
@@ -113,9 +158,6 @@ async def newaddr(
             a.pubkey_compressed,
             p
         )
-    except ValueError:
-        raise InvalidPasswordError
-
     except AssertionError as e:
         # address already exists
         raise HTTPException(status.HTTP_409_CONFLICT, str(e))
@@ -128,10 +170,68 @@ async def newaddr(
     description='Generate private key, get address and save it'
 )
 async def create_address(
-    user: Annotated[User, Depends(currentuser)],
+    session: Annotated[UserSession, Depends(currentsession)],
     a: schema.CreateAddressIn
 ):
-    return await newaddr(user, a)
+    return await newaddr(session, a)
+
+
+@router.post(
+    '/address:batch',
+    response_model=list[schema.UserAddressOut],
+    description='Generate many private keys (common key is decrypted once), save them with addresses'
+)
+async def create_addresses(
+    session: Annotated[UserSession, Depends(currentsession)],
+    a: schema.CreateAddressesIn
+):
+    shortnames = a.shortnames
+    if exists := await crud.get_existing_shortnames(session.user.id, shortnames):
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST,
+            f"address with shortname '{exists[0]}' already exists"
+        )
+
+    ck = await commonkey(session, a.userpassword)
+    keys = await keygen.generate(ck, a.count, a.type, a.network, a.pubkey_compressed)
+    return await crud.create_addresses(
+        session.user,
+        keys,
+        a.type,
+        a.network,
+        shortnames,
+        a.emojid,
+        a.pubkey_compressed
+    )
+
+
+@router.post(
+    '/hd',
+    status_code=status.HTTP_204_NO_CONTENT,
+    description='Generate hd wallet seed, then addresses can be derived without userpassword'
+)
+async def create_hd_wallet(
+    session: Annotated[UserSession, Depends(currentsession)],
+    input: schema.CreateHDWalletIn
+):
+    ck = await commonkey(session, input.userpassword)
+    if not await crud.create_seed(session.user.id, ck, cu.generatekey(hd.SEED_LENGTH)):
+        raise HTTPException(status.HTTP_409_CONFLICT, 'hd wallet already exists')
+
+
+@router.post(
+    '/address:derive',
+    response_model=schema.UserAddressOut,
+    dependencies=[Depends(check_shortname_exists)],
+    description='Derive next address of hd wallet chain (BIP44/49/84 by type)'
+)
+async def derive_address(
+    user: Annotated[User, Depends(currentuser)],
+    a: schema.DeriveAddressIn
+):
+    if not (address := await crud.derive_address(user.id, a.type, a.network, a.shortname, a.emojid)):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, 'hd wallet is not created')
+    return address
 
 
 @router.post(
@@ -140,11 +240,11 @@ async def create_address(
     response_model=schema.UserAddressOut
 )
 async def import_address(
-    user: Annotated[User, Depends(currentuser)],
+    session: Annotated[UserSession, Depends(currentsession)],
     p: Annotated[PrivateKey, Depends(pvfrom)],
     a: schema.ImportAddressIn
 ):
-    return await newaddr(user, a, p)
+    return await newaddr(session, a, p)
 
 
 @router.put(
@@ -175,62 +275,176 @@ async def delete_address(
     await crud.delete_address(address)
 
 
-@router.post('/transaction')
-async def create_transaction(
-    user: Annotated[User, Depends(currentuser)],
-    input: schema.CreateTransactionIn
-) -> schema.CreateTransactionOut:
-    try:
-        ck = cu.kdfdecrypt(
-            input.userpassword,
-            user.ckey_encrypted,
-            user.kdf_options,
-            user.kdf_digest
-        )
-    except ValueError:
-        raise InvalidPasswordError
-
+def txoutputs(outputs: list[schema.CreateTransactionOutputAddress | schema.CreateTransactionOutputPkscript]) -> list[Output]:
+    r = []
+    for o in outputs:
+        if isinstance(o, schema.CreateTransactionOutputPkscript):
+            pkscript = Script.deserialize(o.pkscript)
+        else:
+            pkscript = o.instance.pkscript
+        r.append(Output(pkscript, o.amount))
+    return r
+
+
+async def signtx(
+    session: UserSession,
+    password: str | None,
+    inputs: list[schema.CreateTransactionInput],
+    outputs: list[Output],
+    version: int,
+    locktime: int
+) -> bytes:
+    """
+    :return: Serialized signed transaction
+    """
+    ck = await commonkey(session, password)
     addresses = {
         addr.string: addr
         for addr in await crud.get_addresses(
-            user.id,
-            (i.address for i in input.inputs))
+            session.user.id,
+            (i.address for i in inputs))
         }
-
-    inputs = []
-    for i in input.inputs:
-        addressmodel = addresses.get(i.address)
-        if not addressmodel:
+    for i in inputs:
+        if i.address not in addresses:
             raise HTTPException(
                 status.HTTP_400_BAD_REQUEST,
                 f"address {i.address} does not belong to user (could not be found)"
             )
-        p = PrivateKey.from_bytes(cu.decrypt(ck, addressmodel.key.encrypted))
-        addr = p.public.change_network(addressmodel.network).get_address(addressmodel.type)
-        if addressmodel.string != addr.string:
+    seed = None
+    if any(a.hdindex is not None for a in addresses.values()):
+        seed = await crud.get_seed(session.user.id)
+    try:
+        rawkeys = signing.decrypt_keys(ck, addresses.values(), seed)
+    except ValueError as e:
+        raise HTTPException(
+            status.HTTP_500_INTERNAL_SERVER_ERROR,
+            f"saved private key doesnt belong to address '{e}'"
+        )
+
+    tx = Transaction(
+        [UnsignableInput(bytes.fromhex(i.txid), i.vout, i.amount, i.sequence) for i in inputs],
+        outputs,
+        version,
+        locktime
+    )
+    return await signing.sign(tx, {n: (rawkeys[i.address], i.address) for n, i in enumerate(inputs)})
+
+
+@router.post('/transaction')
+async def create_transaction(
+    session: Annotated[UserSession, Depends(currentsession)],
+    input: schema.CreateTransactionIn
+) -> schema.CreateTransactionOut:
+    serialized = await signtx(
+        session,
+        input.userpassword,
+        input.inputs,
+        txoutputs(input.outputs),
+        input.version,
+        input.locktime
+    )
+    return schema.CreateTransactionOut(serialized=serialized.hex())
+
+
+@router.post(
+    '/transaction:estimate',
+    description='Select unspent of user addresses (from explorer cache) for outputs and estimate fee'
+)
+async def estimate_transaction(
+    user: Annotated[User, Depends(currentuser)],
+    input: schema.EstimateTransactionIn
+) -> schema.EstimateTransactionOut:
+    return await selectcoins(user, input)
+
+
+async def selectcoins(
+    user: User,
+    input: schema.EstimateTransactionIn,
+    refresh: bool = False
+) -> schema.EstimateTransactionOut:
+    """
+    :param refresh: Update unspent of spent addresses from explorer before selection, cached
+                    ones can be already spent (or miss new ones)
+    """
+    useraddresses = {a.string: a for a in await crud.get_user_addresses(user.id) if a.network == input.network}
+    for string in [*(input.addresses or []), *([input.change] if input.change else [])]:
+        if string not in useraddresses:
             raise HTTPException(
-                status.HTTP_500_INTERNAL_SERVER_ERROR,
-                f"saved private key doesnt belong to address '{addressmodel.string}'"
+                status.HTTP_400_BAD_REQUEST,
+                f"address {string} does not belong to user (could not be found)"
             )
-        inputs.append(
-            Input(
-                bytes.fromhex(i.txid),
-                i.vout,
-                i.amount,
-                p,
-                addr,
-                i.sequence
+    spend = useraddresses if input.addresses is None else {a: useraddresses[a] for a in input.addresses}
+    if refresh:
+        strings, size = list(spend), settings.EXPLORER_BATCH_MAX_ADDRESSES
+        for i in range(0, len(strings), size):
+            await explorerservice.fetch_unspent_batch(
+                [address.from_string(a) for a in strings[i:i + size]],
+                input.network,
+                include_transaction=False
             )
+        if explorerservice.stale.get():
+            raise ServiceUnavailableError
+
+    coins = [
+        coinselect.Coin(
+            u.txid,
+            u.vout,
+            u.amount,
+            u.address,
+            spend[u.address].type,
+            spend[u.address].is_pubkey_compressed
         )
+        for u in await explorercrud.find_unspent(list(spend), input.network)
+    ]
+    if not coins:
+        raise InsufficientFundsError
+
+    change = useraddresses[input.change] if input.change else spend[max(coins, key=lambda c: c.amount).address]
+    changepkscript = address.from_string(change.string).pkscript.serialize()
+    outputs = txoutputs(input.outputs)
+    try:
+        selection = coinselect.select(
+            coins,
+            sum(o.amount for o in outputs),
+            sum(coinselect.output_vsize(o.pkscript.serialize()) for o in outputs),
+            changepkscript,
+            change.type,
+            change.is_pubkey_compressed,
+            input.feerate
+        )
+    except coinselect.InsufficientFunds:
+        raise InsufficientFundsError
+
+    return schema.EstimateTransactionOut(
+        inputs=[
+            schema.CreateTransactionInput(txid=c.txid.hex(), vout=c.vout, amount=c.amount, address=c.address)
+            for c in selection.coins
+        ],
+        change=schema.CreateTransactionOutputAddress(
+            address=change.string,
+            amount=selection.change
+        ) if selection.change else None,
+        fee=selection.fee,
+        vsize=selection.vsize
+    )
 
-    outputs = []
-    for o in input.outputs:
-        if isinstance(o, schema.CreateTransactionOutputPkscript):
-            pkscript = Script.deserialize(o.pkscript)
-        else:
-            pkscript = o.instance.pkscript
-        outputs.append(Output(pkscript, o.amount))
 
-    tx = Transaction(inputs, outputs, input.version, input.locktime)
-    tx.default_sign()
-    return schema.CreateTransactionOut(serialized=tx.serialize().hex())
+@router.post(
+    '/transaction:auto',
+    description='Select unspent (see /transaction:estimate, but unspent are updated from explorer first) '
+                'and create signed transaction'
+)
+async def auto_transaction(
+    session: Annotated[UserSession, Depends(currentsession)],
+    input: schema.AutoTransactionIn
+) -> schema.AutoTransactionOut:
+    estimate = await selectcoins(session.user, input, refresh=True)
+    serialized = await signtx(
+        session,
+        input.userpassword,
+        estimate.inputs,
+        txoutputs([*input.outputs, *([estimate.change] if estimate.change else [])]),
+        input.version,
+        input.locktime
+    )
+    return schema.AutoTransactionOut(serialized=serialized.hex(), **estimate.model_dump())